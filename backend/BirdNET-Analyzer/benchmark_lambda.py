@@ -0,0 +1,70 @@
+"""Throughput benchmark for the audio Lambda's batched inference.
+
+Runs lambda_function.predict on synthetic audio at several batch sizes
+and prints windows per second for each.
+
+Usage: python benchmark_lambda.py [--minutes 10] [--batch-sizes 1 8 32 64]
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+# lambda_function creates boto3 clients at import time
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import lambda_function  # noqa: E402
+
+DEFAULT_MODEL_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "birdnet_analyzer/checkpoints/V2.4/BirdNET_GLOBAL_6K_V2.4_Model_FP16.tflite",
+)
+
+
+def benchmark_predict(model_path, minutes, batch_sizes, repeats=3):
+    """Times predict() over the same synthetic signal for each batch size.
+
+    Args:
+        model_path: Path to the BirdNET TFLite model.
+        minutes: Length of the synthetic recording in minutes.
+        batch_sizes: Batch sizes to compare.
+        repeats: Number of timed runs per batch size; the fastest is reported.
+
+    Returns:
+        A dict mapping batch size to windows per second.
+    """
+    rng = np.random.default_rng(42)
+    sig = rng.normal(0, 0.1, int(minutes * 60 * lambda_function.SAMPLE_RATE)).astype(np.float32)
+
+    interpreter = lambda_function.tflite.Interpreter(model_path=model_path, num_threads=1)
+    interpreter.allocate_tensors()
+
+    results = {}
+
+    for bs in batch_sizes:
+        # Warm-up run also performs the one-off tensor resize
+        lambda_function.predict(interpreter, sig[: int(lambda_function.SIG_LENGTH * lambda_function.SAMPLE_RATE) * bs], bs)
+
+        best = float("inf")
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            preds = lambda_function.predict(interpreter, sig, bs)
+            best = min(best, time.perf_counter() - t0)
+
+        results[bs] = len(preds) / best
+        print(f"batch_size={bs:>3}: {len(preds)} windows in {best:.2f}s -> {results[bs]:.1f} windows/s", flush=True)
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark batched Lambda inference on synthetic audio.")
+    parser.add_argument("--model", default=os.environ.get("MODEL_PATH", DEFAULT_MODEL_PATH))
+    parser.add_argument("--minutes", type=float, default=10.0)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    benchmark_predict(args.model, args.minutes, args.batch_sizes, args.repeats)
@@ -0,0 +1,123 @@
+"""Equivalence check and benchmark for merge_consecutive_detections.
+
+Compares the linear-time merge with the previous list.pop() based implementation
+on randomized detection tables, then times both on a synthetic 24-hour recording
+with dense detections.
+
+Usage: python benchmark_merge.py [--hours 24] [--species 20] [--density 0.8]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from birdnet_analyzer.analyze.utils import make_detections, merge_consecutive_detections
+
+
+def reference_merge(detections, max_consecutive=None):
+    """The previous quadratic implementation, kept as the reference for equivalence."""
+    if max_consecutive is not None and max_consecutive <= 1 or len(detections) == 0:
+        return detections
+
+    _, first, label_rank = np.unique(detections["label"], return_index=True, return_inverse=True)
+    label_rank = np.argsort(np.argsort(first))[label_rank]
+    detections = detections[np.lexsort((detections["start"], label_rank))]
+    groups = np.split(np.arange(len(detections)), np.flatnonzero(np.diff(detections["label"])) + 1)
+
+    starts, ends, labels, scores = [], [], [], []
+    for group in groups:
+        label = int(detections["label"][group[0]])
+        timestamps = list(zip(*(detections[c][group].tolist() for c in ("start", "end", "score"))))
+
+        i = 0
+        while i < len(timestamps) - 1:
+            start, end, _ = timestamps[i]
+            next_start, next_end, _ = timestamps[i + 1]
+
+            if end >= next_start:
+                merged_scores = [timestamps[i][2], timestamps[i + 1][2]]
+                timestamps.pop(i)
+
+                while i < len(timestamps) - 1 and next_end >= timestamps[i + 1][0]:
+                    if max_consecutive and len(merged_scores) >= max_consecutive:
+                        break
+                    merged_scores.append(timestamps[i + 1][2])
+                    next_end = timestamps[i + 1][1]
+                    timestamps.pop(i + 1)
+
+                top_3_scores = sorted(merged_scores, reverse=True)[:3]
+                timestamps[i] = (start, next_end, sum(top_3_scores) / len(top_3_scores))
+
+            i += 1
+
+        for start, end, score in timestamps:
+            starts.append(start)
+            ends.append(end)
+            labels.append(label)
+            scores.append(score)
+
+    return make_detections(starts, ends, labels, scores)
+
+
+def synthetic_detections(rng, hours, species, density, overlap=0.0, seg_length=3.0):
+    """Detections of `species` labels, each present in a `density` fraction of all windows."""
+    step = seg_length - overlap
+    window_starts = np.round(np.arange(0, hours * 3600 - seg_length + step, step), 1)
+
+    window_idx, label = np.nonzero(rng.random((len(window_starts), species)) < density)
+    start = window_starts[window_idx]
+
+    return make_detections(start, np.round(start + seg_length, 1), rng.permutation(6522)[label], rng.random(len(label)))
+
+
+def check_equivalence(cases=500, seed=0):
+    """Asserts that both implementations agree on randomized tables and settings."""
+    rng = np.random.default_rng(seed)
+
+    for case in range(cases):
+        detections = synthetic_detections(
+            rng,
+            hours=rng.uniform(0.001, 0.05),
+            species=int(rng.integers(1, 8)),
+            density=rng.uniform(0.05, 1.0),
+            overlap=float(rng.choice([0.0, 1.0, 1.5, 2.0])),
+        )
+        # Table order is insertion order, not necessarily time order
+        detections = detections[rng.permutation(len(detections))]
+
+        for max_consecutive in (None, 0, 1, 2, 3, 5):
+            expected = reference_merge(detections, max_consecutive)
+            actual = merge_consecutive_detections(detections, max_consecutive)
+
+            assert np.array_equal(expected, actual), f"case {case}, max_consecutive={max_consecutive}"
+
+    print(f"{cases} randomized cases identical", flush=True)
+
+
+def benchmark(hours, species, density, max_consecutive=None, skip_reference=False):
+    """Times both implementations on one synthetic recording."""
+    detections = synthetic_detections(np.random.default_rng(42), hours, species, density)
+    print(f"{len(detections)} detections over {hours} h, {species} species", flush=True)
+
+    runs = [("linear", merge_consecutive_detections)]
+    if not skip_reference:
+        runs.append(("reference", reference_merge))
+
+    for name, merge in runs:
+        t0 = time.perf_counter()
+        merged = merge(detections, max_consecutive)
+        print(f"{name:>9}: {time.perf_counter() - t0:.3f}s -> {len(merged)} merged detections", flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check and benchmark merging of consecutive detections.")
+    parser.add_argument("--hours", type=float, default=24.0)
+    parser.add_argument("--species", type=int, default=20)
+    parser.add_argument("--density", type=float, default=0.8)
+    parser.add_argument("--max_consecutive", type=int, default=None)
+    parser.add_argument("--skip_reference", action="store_true", help="Only time the linear implementation.")
+    args = parser.parse_args()
+
+    check_equivalence()
+    benchmark(args.hours, args.species, args.density, args.max_consecutive, args.skip_reference)
@@ -0,0 +1,85 @@
+"""Micro-benchmark for interpreter reuse in birdnet_analyzer.model.predict.
+
+Times BirdNETModel.predict, which only reallocates the interpreter when the batch shape
+changes, against the previous behaviour of resizing and reallocating on every call.
+Each run feeds a sequence of full batches followed by a shorter tail batch, as
+analyze_file does for one recording.
+
+Usage: python benchmark_model.py [--batch-sizes 1 4 16] [--batches 20] [--repeats 3]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+import birdnet_analyzer.config as cfg
+from birdnet_analyzer import model
+
+
+def reallocating_predictor(handle):
+    """The previous implementation, which resized the input tensor on every call, on its own interpreter."""
+    interpreter = model.tflite.Interpreter(model_path=handle.model_path, num_threads=handle.num_threads)
+    interpreter.allocate_tensors()
+    input_index = interpreter.get_input_details()[0]["index"]
+    output_index = interpreter.get_output_details()[0]["index"]
+
+    def predict(sample):
+        interpreter.resize_tensor_input(input_index, [len(sample), *sample[0].shape])
+        interpreter.allocate_tensors()
+        interpreter.set_tensor(input_index, np.array(sample, dtype="float32"))
+        interpreter.invoke()
+
+        return interpreter.get_tensor(output_index)
+
+    return predict
+
+
+def synthetic_batches(batch_size, batches, rng):
+    """`batches` full batches of random 3-second windows plus one shorter tail batch."""
+    window = int(cfg.SIG_LENGTH * cfg.SAMPLE_RATE)
+    sizes = [batch_size] * batches + [max(1, batch_size // 2)]
+
+    return [rng.normal(0, 0.1, (n, window)).astype("float32") for n in sizes]
+
+
+def benchmark(batch_sizes, batches, repeats=3):
+    """Times both implementations on the same batches and checks they agree.
+
+    Args:
+        batch_sizes: Batch sizes to compare.
+        batches: Number of full batches per run.
+        repeats: Number of timed runs per implementation; the fastest is reported.
+    """
+    handle = model.BirdNETModel()
+    handle.load()
+    reallocating_predict = reallocating_predictor(handle)
+    rng = np.random.default_rng(42)
+
+    for bs in batch_sizes:
+        data = synthetic_batches(bs, batches, rng)
+        windows = sum(len(b) for b in data)
+
+        for name, predict in (("reuse", handle.predict), ("reallocate", reallocating_predict)):
+            best = float("inf")
+            for _ in range(repeats):
+                t0 = time.perf_counter()
+                results = [predict(b) for b in data]
+                best = min(best, time.perf_counter() - t0)
+
+            print(f"batch_size={bs:>3} {name:>10}: {best:.3f}s -> {windows / best:.1f} windows/s", flush=True)
+
+        # Both paths must produce the same scores
+        assert all(np.allclose(handle.predict(b), r) for b, r in zip(data, results))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark interpreter reuse across predict calls.")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--batches", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=1)
+    args = parser.parse_args()
+
+    cfg.TFLITE_THREADS = args.threads
+    benchmark(args.batch_sizes, args.batches, args.repeats)
@@ -27,6 +27,10 @@ def analyze(
     merge_consecutive: int = 1,
     threads: int = 8,
     locale: str = "en",
+    energy_gate: float = 0,
+    cross_file_batching: bool = False,
+    threaded: bool = False,
+    species_cache_dir: str | None = None,
 ):
     """
     Analyzes audio files for bird species detection using the BirdNET-Analyzer.
@@ -54,6 +58,10 @@ def analyze(
         merge_consecutive (int, optional): Merge consecutive detections within this time window in seconds. Defaults to 1.
         threads (int, optional): Number of CPU threads to use for analysis. Defaults to 8.
         locale (str, optional): Locale for species names and output. Defaults to "en".
+        energy_gate (float, optional): Skip windows whose energy is not above this multiple of the adaptive noise floor. Defaults to 0 (disabled).
+        cross_file_batching (bool, optional): Fill inference batches with windows from several files, for folders of short clips. Defaults to False.
+        threaded (bool, optional): Analyze files in threads of a single process that share the model weights, instead of separate processes. Defaults to False.
+        species_cache_dir (str | None, optional): Folder that keeps location filter results across runs. Defaults to None (no disk cache).
     Returns:
         None
     Raises:
@@ -64,9 +72,10 @@ def analyze(
         - Analysis parameters are saved to a file in the output directory.
     """
     from multiprocessing import Pool
+    from multiprocessing.pool import ThreadPool
 
     import birdnet_analyzer.config as cfg
-    from birdnet_analyzer.analyze.utils import analyze_file, save_analysis_params
+    from birdnet_analyzer.analyze.utils import analyze_file, analyze_files_batched, init_worker, save_analysis_params
     from birdnet_analyzer.analyze.utils import combine_results as combine
     from birdnet_analyzer.utils import ensure_model_exists
 
@@ -95,6 +104,10 @@ def analyze(
         merge_consecutive=merge_consecutive,
         skip_existing_results=skip_existing_results,
         threads=threads,
+        energy_gate=energy_gate,
+        cross_file_batching=cross_file_batching,
+        threaded=threaded,
+        species_cache_dir=species_cache_dir,
         labels_file=cfg.LABELS_FILE,
     )
 
@@ -108,16 +121,27 @@ def analyze(
     result_files = []
 
     # Analyze files
-    if cfg.CPU_THREADS < 2 or len(flist) < 2:
+    if cfg.CROSS_FILE_BATCHING:
+        result_files = analyze_files_batched(flist)
+    elif cfg.CPU_THREADS < 2 or len(flist) < 2:
         for entry in flist:
             result_files.append(analyze_file(entry))
     else:
-        with Pool(cfg.CPU_THREADS) as p:
-            # Map analyzeFile function to each entry in flist
-            results = p.map_async(analyze_file, flist)
-            # Wait for all tasks to complete
-            results.wait()
-            result_files = results.get()
+        if cfg.THREADED_ANALYSIS:
+            # Threads share the config and the model weights, each thread creates its own interpreter
+            pool = ThreadPool(cfg.CPU_THREADS)
+        else:
+            # Every worker receives the config and loads the model once, tasks only carry the file path
+            pool = Pool(cfg.CPU_THREADS, initializer=init_worker, initargs=(cfg.get_config(),))
+
+        with pool as p:
+            tasks = [(i, (f, None)) for i, (f, _) in enumerate(flist)]
+            chunksize = max(1, len(tasks) // (cfg.CPU_THREADS * 4))
+            result_files = [None] * len(tasks)
+
+            # Collect as files finish, but keep the input order for combining
+            for i, result in p.imap_unordered(_analyze_indexed, tasks, chunksize):
+                result_files[i] = result
 
     # Combine results?
     if cfg.COMBINE_RESULTS:
@@ -128,6 +152,14 @@ def analyze(
     save_analysis_params(os.path.join(cfg.OUTPUT_PATH, cfg.ANALYSIS_PARAMS_FILENAME))
 
 
+def _analyze_indexed(task):
+    """Runs analyze_file on an (index, item) task and returns (index, result)."""
+    from birdnet_analyzer.analyze.utils import analyze_file
+
+    i, item = task
+    return i, analyze_file(item)
+
+
 def _set_params(
     input,
     output,
@@ -151,6 +183,10 @@ def _set_params(
     top_n,
     merge_consecutive,
     threads,
+    energy_gate=0,
+    cross_file_batching=False,
+    threaded=False,
+    species_cache_dir=None,
     labels_file=None,
 ):
     import birdnet_analyzer.config as cfg
@@ -174,6 +210,10 @@ def _set_params(
     cfg.RESULT_TYPES = rtype
     cfg.COMBINE_RESULTS = combine_results
     cfg.BATCH_SIZE = bs
+    cfg.ENERGY_GATE = energy_gate
+    cfg.CROSS_FILE_BATCHING = cross_file_batching
+    cfg.THREADED_ANALYSIS = threaded
+    cfg.SPECIES_MASK_CACHE_DIR = species_cache_dir
 
     if not output:
         if os.path.isfile(cfg.INPUT_PATH):
@@ -188,7 +228,8 @@ def _set_params(
     else:
         cfg.FILE_LIST = [cfg.INPUT_PATH]
 
-    if os.path.isdir(cfg.INPUT_PATH):
+    # Cross-file batching runs a single inference loop, so the threads go to TFLite
+    if os.path.isdir(cfg.INPUT_PATH) and not cross_file_batching:
         cfg.CPU_THREADS = threads
         cfg.TFLITE_THREADS = 1
     else:
@@ -242,4 +283,7 @@ def _set_params(
     else:
         cfg.TRANSLATED_LABELS = cfg.LABELS
 
-    return [(f, cfg.get_config()) for f in cfg.FILE_LIST]
+    # One shared snapshot; get_config() copies every setting, including FILE_LIST itself
+    config = cfg.get_config()
+
+    return [(f, config) for f in cfg.FILE_LIST]
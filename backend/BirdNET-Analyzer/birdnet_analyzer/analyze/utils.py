@@ -1,9 +1,14 @@
 """Module to analyze audio samples."""
 
+import abc
 import datetime
+import heapq
 import json
-import operator
 import os
+import queue
+import shutil
+import threading
+from typing import NamedTuple
 
 import numpy as np
 
@@ -20,6 +25,8 @@ KALEIDOSCOPE_HEADER = (
 )
 CSV_HEADER = "Start (s),End (s),Scientific name,Common name,Confidence,File\n"
 SCRIPT_DIR = os.path.abspath(os.path.dirname(__file__))
+# One row per detection: segment start and end in seconds, label index into cfg.LABELS and score
+DETECTION_DTYPE = np.dtype([("start", "f8"), ("end", "f8"), ("label", "i4"), ("score", "f8")])
 
 
 def save_analysis_params(path):
@@ -36,6 +43,8 @@ def save_analysis_params(path):
             "Merge consecutive detections",
             "Audio speed",
             "Custom classifier path",
+            "Energy gate",
+            "Cross-file batching",
         ),
         (
             cfg.FILE_SPLITTING_DURATION,
@@ -48,6 +57,8 @@ def save_analysis_params(path):
             cfg.MERGE_CONSECUTIVE,
             cfg.AUDIO_SPEED,
             cfg.CUSTOM_CLASSIFIER,
+            cfg.ENERGY_GATE,
+            cfg.CROSS_FILE_BATCHING,
         ),
     )
 
@@ -64,171 +75,253 @@ def load_codes():
     return codes
 
 
-def generate_raven_table(timestamps: list[str], result: dict[str, list], afile_path: str, result_path: str):
+class LabelEntry(NamedTuple):
+    """Output names of one class, taken from the translated label where applicable."""
+
+    scientific_name: str
+    common_name: str
+    audacity_name: str
+    code: str
+
+
+_LABEL_INDEX = (None, None, None, None)
+
+
+def get_label_index() -> list[LabelEntry]:
     """
-    Generates a Raven selection table from the given timestamps and prediction results.
+    Returns the LabelEntry of every class, indexed like cfg.LABELS.
 
-    Args:
-        timestamps (list[str]): List of timestamp strings in the format "start-end".
-        result (dict[str, list]): Dictionary where keys are timestamp strings and values are lists of predictions.
-        afile_path (str): Path to the audio file being analyzed.
-        result_path (str): Path where the resulting Raven selection table will be saved.
+    Labels are split and looked up in cfg.CODES once, instead of for every detection.
+    The index is rebuilt only when cfg.LABELS, cfg.TRANSLATED_LABELS or cfg.CODES are replaced.
+    """
+    global _LABEL_INDEX
+
+    labels, translated, codes, index = _LABEL_INDEX
+
+    if labels is not cfg.LABELS or translated is not cfg.TRANSLATED_LABELS or codes is not cfg.CODES:
+        labels, translated, codes = cfg.LABELS, cfg.TRANSLATED_LABELS, cfg.CODES
+        index = [
+            LabelEntry(
+                t_label.split("_", 1)[0],
+                t_label.split("_", 1)[-1],
+                t_label.replace("_", ", "),
+                codes.get(label, label),
+            )
+            for label, t_label in zip(labels, translated)
+        ]
+        _LABEL_INDEX = (labels, translated, codes, index)
 
-    Returns:
-        None
+    return index
+
+
+class ResultWriter(abc.ABC):
     """
-    selection_id = 0
-    out_string = RAVEN_TABLE_HEADER
+    Streams the rows of one result file through a buffered file handle.
 
-    # Read native sample rate
-    high_freq = audio.get_sample_rate(afile_path) / 2
+    Subclasses format a single detection in write_row(); rows go to disk as they are written,
+    so the whole file never has to be held in memory.
+    """
 
-    if high_freq > int(cfg.SIG_FMAX / cfg.AUDIO_SPEED):
-        high_freq = int(cfg.SIG_FMAX / cfg.AUDIO_SPEED)
+    header = ""
 
-    high_freq = min(high_freq, int(cfg.BANDPASS_FMAX / cfg.AUDIO_SPEED))
-    low_freq = max(cfg.SIG_FMIN, int(cfg.BANDPASS_FMIN / cfg.AUDIO_SPEED))
+    def __init__(self, result_path: str):
+        # Make directory if it doesn't exist
+        os.makedirs(os.path.dirname(result_path), exist_ok=True)
 
-    # Extract valid predictions for every timestamp
-    for timestamp in timestamps:
-        rstring = ""
-        start, end = timestamp.split("-", 1)
+        self.file = open(result_path, "w", encoding="utf-8")
+        self.file.write(self.header)
 
-        for c in result[timestamp]:
-            selection_id += 1
-            label = cfg.TRANSLATED_LABELS[cfg.LABELS.index(c[0])]
-            code = cfg.CODES[c[0]] if c[0] in cfg.CODES else c[0]
-            rstring += f"{selection_id}\tSpectrogram 1\t1\t{start}\t{end}\t{low_freq}\t{high_freq}\t{label.split('_', 1)[-1]}\t{code}\t{c[1]:.4f}\t{afile_path}\t{start}\n"
+    @abc.abstractmethod
+    def write_row(self, start: float, end: float, entry: LabelEntry, score: float):
+        """Writes the row of one detection."""
 
-        # Write result string to file
-        out_string += rstring
+    def close(self):
+        self.file.close()
 
-    # If we don't have any valid predictions, we still need to add a line to the selection table in case we want to combine results
-    # TODO: That's a weird way to do it, but it works for now. It would be better to keep track of file durations during the analysis.
-    if len(out_string) == len(RAVEN_TABLE_HEADER) and cfg.OUTPUT_PATH is not None:
-        selection_id += 1
-        out_string += (
-            f"{selection_id}\tSpectrogram 1\t1\t0\t3\t{low_freq}\t{high_freq}\tnocall\tnocall\t1.0\t{afile_path}\t0\n"
-        )
 
-    utils.save_result_file(result_path, out_string)
+class RavenTableWriter(ResultWriter):
+    """Writes a Raven selection table."""
 
+    header = RAVEN_TABLE_HEADER
 
-def generate_audacity(timestamps: list[str], result: dict[str, list], result_path: str):
-    """
-    Generates an Audacity timeline label file from the given timestamps and results.
+    def __init__(self, result_path: str, afile_path: str, sample_rate: int | None = None):
+        super().__init__(result_path)
+        self.afile_path = afile_path
+        self.selection_id = 0
 
-    Args:
-        timestamps (list[str]): A list of timestamp strings.
-        result (dict[str, list]): A dictionary where keys are timestamps and values are lists of tuples,
-                                  each containing a label and a confidence score.
-        result_path (str): The file path where the result string will be saved.
+        # Native sample rate, read from the file unless it was captured during analysis
+        if sample_rate is None:
+            sample_rate = audio.get_sample_rate(afile_path)
 
-    Returns:
-        None
-    """
-    out_string = ""
+        high_freq = sample_rate / 2
 
-    # Audacity timeline labels
-    for timestamp in timestamps:
-        rstring = ""
+        if high_freq > int(cfg.SIG_FMAX / cfg.AUDIO_SPEED):
+            high_freq = int(cfg.SIG_FMAX / cfg.AUDIO_SPEED)
 
-        for c in result[timestamp]:
-            label = cfg.TRANSLATED_LABELS[cfg.LABELS.index(c[0])]
-            ts = timestamp.replace("-", "\t")
-            lbl = label.replace("_", ", ")
-            rstring += f"{ts}\t{lbl}\t{c[1]:.4f}\n"
+        self.high_freq = min(high_freq, int(cfg.BANDPASS_FMAX / cfg.AUDIO_SPEED))
+        self.low_freq = max(cfg.SIG_FMIN, int(cfg.BANDPASS_FMIN / cfg.AUDIO_SPEED))
 
-        # Write result string to file
-        out_string += rstring
+    def write_row(self, start, end, entry, score):
+        self.selection_id += 1
+        self.file.write(
+            f"{self.selection_id}\tSpectrogram 1\t1\t{start}\t{end}\t{self.low_freq}\t{self.high_freq}\t{entry.common_name}\t{entry.code}\t{score:.4f}\t{self.afile_path}\t{start}\n"
+        )
 
-    utils.save_result_file(result_path, out_string)
+    def close(self):
+        # If we don't have any valid predictions, we still need to add a line to the selection table in case we want to combine results
+        # TODO: That's a weird way to do it, but it works for now. It would be better to keep track of file durations during the analysis.
+        if self.selection_id == 0 and cfg.OUTPUT_PATH is not None:
+            self.selection_id += 1
+            self.file.write(
+                f"{self.selection_id}\tSpectrogram 1\t1\t0\t3\t{self.low_freq}\t{self.high_freq}\tnocall\tnocall\t1.0\t{self.afile_path}\t0\n"
+            )
 
+        super().close()
 
-def generate_kaleidoscope(timestamps: list[str], result: dict[str, list], afile_path: str, result_path: str):
-    """
-    Generates a Kaleidoscope-compatible CSV string from the given timestamps and results, and saves it to a file.
 
-    Args:
-        timestamps (list[str]): List of timestamp strings in the format "start-end".
-        result (dict[str, list]): Dictionary where keys are timestamp strings and values are lists of tuples containing
-                                  species label and confidence score.
-        afile_path (str): Path to the audio file being analyzed.
-        result_path (str): Path where the resulting CSV file will be saved.
+class AudacityWriter(ResultWriter):
+    """Writes an Audacity timeline label file."""
 
-    Returns:
-        None
-    """
-    out_string = KALEIDOSCOPE_HEADER
+    def write_row(self, start, end, entry, score):
+        self.file.write(f"{start}\t{end}\t{entry.audacity_name}\t{score:.4f}\n")
+
+
+class KaleidoscopeWriter(ResultWriter):
+    """Writes a Kaleidoscope-compatible CSV file."""
+
+    header = KALEIDOSCOPE_HEADER
 
-    folder_path, filename = os.path.split(afile_path)
-    parent_folder, folder_name = os.path.split(folder_path)
+    def __init__(self, result_path: str, afile_path: str):
+        super().__init__(result_path)
 
-    for timestamp in timestamps:
-        rstring = ""
-        start, end = timestamp.split("-", 1)
+        folder_path, self.filename = os.path.split(afile_path)
+        parent_folder, self.folder_name = os.path.split(folder_path)
+        self.parent_folder = parent_folder.rstrip("/")
 
-        for c in result[timestamp]:
-            label = cfg.TRANSLATED_LABELS[cfg.LABELS.index(c[0])]
-            rstring += "{},{},{},{},{},{},{},{:.4f},{:.4f},{:.4f},{},{},{}\n".format(
-                parent_folder.rstrip("/"),
-                folder_name,
-                filename,
+    def write_row(self, start, end, entry, score):
+        self.file.write(
+            "{},{},{},{},{},{},{},{:.4f},{:.4f},{:.4f},{},{},{}\n".format(
+                self.parent_folder,
+                self.folder_name,
+                self.filename,
                 start,
-                float(end) - float(start),
-                label.split("_", 1)[0],
-                label.split("_", 1)[-1],
-                c[1],
+                end - start,
+                entry.scientific_name,
+                entry.common_name,
+                score,
                 cfg.LATITUDE,
                 cfg.LONGITUDE,
                 cfg.WEEK,
                 cfg.SIG_OVERLAP,
                 cfg.SIGMOID_SENSITIVITY,
             )
+        )
+
+
+class CsvWriter(ResultWriter):
+    """Writes a BirdNET CSV result file."""
+
+    header = CSV_HEADER
 
-        # Write result string to file
-        out_string += rstring
+    def __init__(self, result_path: str, afile_path: str):
+        super().__init__(result_path)
+        self.afile_path = afile_path
 
-    utils.save_result_file(result_path, out_string)
+    def write_row(self, start, end, entry, score):
+        self.file.write(f"{start},{end},{entry.scientific_name},{entry.common_name},{score:.4f},{self.afile_path}\n")
 
 
-def generate_csv(timestamps: list[str], result: dict[str, list], afile_path: str, result_path: str):
+def write_results(detections: np.ndarray, writers: list[ResultWriter]):
     """
-    Generates a CSV file from the given timestamps and results.
+    Writes the detections to every given writer in a single pass, then closes the writers.
 
     Args:
-        timestamps (list[str]): A list of timestamp strings in the format "start-end".
-        result (dict[str, list]): A dictionary where keys are timestamp strings and values are lists of tuples.
-                                  Each tuple contains a label and a confidence score.
-        afile_path (str): The file path of the audio file being analyzed.
-        result_path (str): The file path where the resulting CSV file will be saved.
+        detections (np.ndarray): Sorted detections of DETECTION_DTYPE.
+        writers (list[ResultWriter]): The result files to write.
+    """
+    label_index = get_label_index()
+
+    try:
+        for start, end, label_idx, score in iter_detections(detections):
+            entry = label_index[label_idx]
+
+            for writer in writers:
+                writer.write_row(start, end, entry, score)
+    finally:
+        for writer in writers:
+            writer.close()
+
+
+def generate_raven_table(detections: np.ndarray, afile_path: str, result_path: str, sample_rate: int | None = None):
+    """
+    Generates a Raven selection table from the given detections.
+
+    Args:
+        detections (np.ndarray): Sorted detections of DETECTION_DTYPE.
+        afile_path (str): Path to the audio file being analyzed.
+        result_path (str): Path where the resulting Raven selection table will be saved.
+        sample_rate (int, optional): Native sample rate of the audio file. Read from the file if not given.
+
+    Returns:
+        None
+    """
+    write_results(detections, [RavenTableWriter(result_path, afile_path, sample_rate)])
+
+
+def generate_audacity(detections: np.ndarray, result_path: str):
+    """
+    Generates an Audacity timeline label file from the given detections.
+
+    Args:
+        detections (np.ndarray): Sorted detections of DETECTION_DTYPE.
+        result_path (str): The file path where the result string will be saved.
 
     Returns:
         None
     """
-    out_string = CSV_HEADER
+    write_results(detections, [AudacityWriter(result_path)])
+
 
-    for timestamp in timestamps:
-        rstring = ""
+def generate_kaleidoscope(detections: np.ndarray, afile_path: str, result_path: str):
+    """
+    Generates a Kaleidoscope-compatible CSV file from the given detections.
 
-        for c in result[timestamp]:
-            start, end = timestamp.split("-", 1)
-            label = cfg.TRANSLATED_LABELS[cfg.LABELS.index(c[0])]
-            rstring += f"{start},{end},{label.split('_', 1)[0]},{label.split('_', 1)[-1]},{c[1]:.4f},{afile_path}\n"
+    Args:
+        detections (np.ndarray): Sorted detections of DETECTION_DTYPE.
+        afile_path (str): Path to the audio file being analyzed.
+        result_path (str): Path where the resulting CSV file will be saved.
 
-        # Write result string to file
-        out_string += rstring
+    Returns:
+        None
+    """
+    write_results(detections, [KaleidoscopeWriter(result_path, afile_path)])
+
+
+def generate_csv(detections: np.ndarray, afile_path: str, result_path: str):
+    """
+    Generates a CSV file from the given detections.
+
+    Args:
+        detections (np.ndarray): Sorted detections of DETECTION_DTYPE.
+        afile_path (str): The file path of the audio file being analyzed.
+        result_path (str): The file path where the resulting CSV file will be saved.
 
-    utils.save_result_file(result_path, out_string)
+    Returns:
+        None
+    """
+    write_results(detections, [CsvWriter(result_path, afile_path)])
 
 
-def save_result_files(r: dict[str, list], result_files: dict[str, str], afile_path: str):
+def save_result_files(detections: np.ndarray, result_files: dict[str, str], afile_path: str):
     """
     Saves the result files in various formats based on the provided configuration.
 
+    All selected result types are written in one pass over the detections.
+
     Args:
-        r (dict[str, list]): A dictionary containing the analysis results with timestamps as keys.
-        result_files (dict[str, str]): A dictionary mapping result types to their respective file paths.
+        detections (np.ndarray): The detections of the analysis, of DETECTION_DTYPE.
+        result_files (dict): A dictionary mapping result types to their respective file paths.
+            May also hold the file's "audio" info from audio.get_audio_file_info.
         afile_path (str): The path to the audio file being analyzed.
 
     Returns:
@@ -238,33 +331,45 @@ def save_result_files(r: dict[str, list], result_files: dict[str, str], afile_pa
     os.makedirs(cfg.OUTPUT_PATH, exist_ok=True)
 
     # Merge consecutive detections of the same species
-    r_merged = merge_consecutive_detections(r, cfg.MERGE_CONSECUTIVE)
+    merged = merge_consecutive_detections(detections, cfg.MERGE_CONSECUTIVE)
 
     # Selection table
-    timestamps = get_sorted_timestamps(r_merged)
+    merged = sort_detections(merged)
 
-    if "table" in result_files:
-        generate_raven_table(timestamps, r_merged, afile_path, result_files["table"])
+    writers = []
 
-    if "audacity" in cfg.RESULT_TYPES:
-        generate_audacity(timestamps, r_merged, result_files["audacity"])
+    try:
+        if "table" in result_files:
+            sample_rate = result_files["audio"]["sample_rate"] if "audio" in result_files else None
+            writers.append(RavenTableWriter(result_files["table"], afile_path, sample_rate))
 
-    # if "r" in cfg.RESULT_TYPES:
-    #     generate_rtable(timestamps, r, afile_path, result_files["r"])
+        if "audacity" in cfg.RESULT_TYPES:
+            writers.append(AudacityWriter(result_files["audacity"]))
 
-    if "kaleidoscope" in cfg.RESULT_TYPES:
-        generate_kaleidoscope(timestamps, r_merged, afile_path, result_files["kaleidoscope"])
+        # if "r" in cfg.RESULT_TYPES:
+        #     generate_rtable(timestamps, r, afile_path, result_files["r"])
 
-    if "csv" in cfg.RESULT_TYPES:
-        generate_csv(timestamps, r_merged, afile_path, result_files["csv"])
+        if "kaleidoscope" in cfg.RESULT_TYPES:
+            writers.append(KaleidoscopeWriter(result_files["kaleidoscope"], afile_path))
+
+        if "csv" in cfg.RESULT_TYPES:
+            writers.append(CsvWriter(result_files["csv"], afile_path))
+    except Exception:
+        for writer in writers:
+            writer.close()
+        raise
+
+    write_results(merged, writers)
 
 
-def combine_raven_tables(saved_results: list[str]):
+def combine_raven_tables(saved_results: list[str], durations: dict[str, float] | None = None):
     """
     Combines multiple Raven selection table files into a single file and adjusts the selection IDs and times.
 
     Args:
         saved_results (list[str]): List of file paths to the Raven selection table files to be combined.
+        durations (dict[str, float], optional): Audio duration in seconds per selection table path,
+            as captured during analysis. Tables not listed are timed by probing their audio file.
 
     Returns:
         None
@@ -282,39 +387,42 @@ def combine_raven_tables(saved_results: list[str]):
                 continue
             with open(rfile, "r", encoding="utf-8") as rf:
                 try:
-                    lines = rf.readlines()
+                    header = rf.readline()
 
                     # make sure it's a selection table
-                    if "Selection" not in lines[0] or "File Offset" not in lines[0]:
+                    if "Selection" not in header or "File Offset" not in header:
                         continue
 
-                    # skip header and add to file
-                    f_name = lines[1].split("\t")[10]
-                    f_duration = audio.get_audio_file_length(f_name)
+                    # The first row names the audio file
+                    line = rf.readline()
+                    f_name = line.split("\t")[10]
+
+                    if durations and rfile in durations:
+                        f_duration = durations[rfile]
+                    else:
+                        f_duration = audio.get_audio_file_length(f_name)
 
                     audiofiles.append(f_name)
 
-                    for line in lines[1:]:
+                    # Stream the rows, parsing each one once
+                    while line:
                         # empty line?
-                        if not line.strip():
-                            continue
-
-                        # Is species code and common name == 'nocall'?
-                        # If so, that's a dummy line and we can skip it
-                        if line.split("\t")[7] == "nocall" and line.split("\t")[8] == "nocall":
-                            continue
+                        if line.strip():
+                            row = line.split("\t")
 
-                        # adjust selection id
-                        line = line.split("\t")
-                        line[0] = str(s_id)
-                        s_id += 1
+                            # Is species code and common name == 'nocall'?
+                            # If so, that's a dummy line and we can skip it
+                            if row[7] != "nocall" or row[8] != "nocall":
+                                # adjust selection id and time
+                                row[0] = str(s_id)
+                                s_id += 1
+                                row[3] = str(float(row[3]) + time_offset)
+                                row[4] = str(float(row[4]) + time_offset)
 
-                        # adjust time
-                        line[3] = str(float(line[3]) + time_offset)
-                        line[4] = str(float(line[4]) + time_offset)
+                                # write line
+                                f.write("\t".join(row))
 
-                        # write line
-                        f.write("\t".join(line))
+                        line = rf.readline()
 
                     # adjust time offset
                     time_offset += f_duration
@@ -342,19 +450,19 @@ def combine_kaleidoscope_files(saved_results: list[str]):
     # Combine all files
     with open(os.path.join(cfg.OUTPUT_PATH, cfg.OUTPUT_KALEIDOSCOPE_FILENAME), "w", encoding="utf-8") as f:
         f.write(KALEIDOSCOPE_HEADER)
+        f.flush()
 
         for rfile in saved_results:
-            with open(rfile, "r", encoding="utf-8") as rf:
+            with open(rfile, "rb") as rf:
                 try:
-                    lines = rf.readlines()
+                    header = rf.readline().decode("utf-8")
 
                     # make sure it's a selection table
-                    if "INDIR" not in lines[0] or "sensitivity" not in lines[0]:
+                    if "INDIR" not in header or "sensitivity" not in header:
                         continue
 
-                    # skip header and add to file
-                    for line in lines[1:]:
-                        f.write(line)
+                    # skip header and copy the rows as they are, without decoding them
+                    shutil.copyfileobj(rf, f.buffer)
 
                 except Exception as ex:
                     print(f"Error: Cannot combine results from {rfile}.\n", flush=True)
@@ -371,19 +479,19 @@ def combine_csv_files(saved_results: list[str]):
     # Combine all files
     with open(os.path.join(cfg.OUTPUT_PATH, cfg.OUTPUT_CSV_FILENAME), "w", encoding="utf-8") as f:
         f.write(CSV_HEADER)
+        f.flush()
 
         for rfile in saved_results:
-            with open(rfile, "r", encoding="utf-8") as rf:
+            with open(rfile, "rb") as rf:
                 try:
-                    lines = rf.readlines()
+                    header = rf.readline().decode("utf-8")
 
                     # make sure it's a selection table
-                    if "Start (s)" not in lines[0] or "Confidence" not in lines[0]:
+                    if "Start (s)" not in header or "Confidence" not in header:
                         continue
 
-                    # skip header and add to file
-                    for line in lines[1:]:
-                        f.write(line)
+                    # skip header and copy the rows as they are, without decoding them
+                    shutil.copyfileobj(rf, f.buffer)
 
                 except Exception as ex:
                     print(f"Error: Cannot combine results from {rfile}.\n", flush=True)
@@ -399,13 +507,16 @@ def combine_results(saved_results: list[dict[str, str]]):
     Args:
         saved_results (list[dict[str, str]]): A list of dictionaries containing
             file paths for different result types. Each dictionary represents
-            a set of result files for a particular analysis.
+            a set of result files for a particular analysis, and may carry the
+            "audio" info of the analyzed file.
 
     Returns:
         None
     """
     if "table" in cfg.RESULT_TYPES:
-        combine_raven_tables([f["table"] for f in saved_results if f])
+        # Durations were captured during analysis, so combining does no audio I/O
+        durations = {f["table"]: f["audio"]["duration"] for f in saved_results if f and "audio" in f}
+        combine_raven_tables([f["table"] for f in saved_results if f], durations)
 
     # if "r" in cfg.RESULT_TYPES:
     #     combine_rtable_files([f["r"] for f in saved_results if f])
@@ -417,89 +528,111 @@ def combine_results(saved_results: list[dict[str, str]]):
         combine_csv_files([f["csv"] for f in saved_results if f])
 
 
-def merge_consecutive_detections(results: dict[str, list], max_consecutive: int = None):
+def make_detections(start, end, label, score) -> np.ndarray:
+    """Builds a detection table of DETECTION_DTYPE from equally long columns."""
+    detections = np.empty(len(label), dtype=DETECTION_DTYPE)
+    detections["start"] = start
+    detections["end"] = end
+    detections["label"] = label
+    detections["score"] = score
+
+    return detections
+
+
+def iter_detections(detections: np.ndarray):
+    """Yields (start, end, label index, score) of every detection as Python scalars."""
+    return zip(
+        detections["start"].tolist(),
+        detections["end"].tolist(),
+        detections["label"].tolist(),
+        detections["score"].tolist(),
+    )
+
+
+def merge_consecutive_detections(detections: np.ndarray, max_consecutive: int = None):
     """Merges consecutive detections of the same species.
     Uses the mean of the top-3 highest scoring predictions as
     confidence score for the merged detection.
 
     Args:
-        results: The dictionary with {segment: scores}.
+        detections: The detections, of DETECTION_DTYPE.
         max_consecutive: The maximum number of consecutive detections to merge. If None, merge all consecutive detections.
 
     Returns:
-        The dictionary with merged detections.
+        The merged detections, grouped by species in order of their first detection.
     """
 
     # If max_consecutive is 0 or 1, return original results
-    if max_consecutive is not None and max_consecutive <= 1:
-        return results
-
-    # For each species, make list of timestamps and scores
-    species = {}
-    for timestamp, scores in results.items():
-        for label, score in scores:
-            if label not in species:
-                species[label] = []
-            species[label].append((timestamp, score))
-
-    # Sort timestamps by start time for each species
-    for label, timestamps in species.items():
-        species[label] = sorted(timestamps, key=lambda t: float(t[0].split("-", 1)[0]))
-
-    # Merge consecutive detections
-    merged_results = {}
-    for label in species:
-        timestamps = species[label]
-
-        # Check if end time of current detection is within the start time of the next detection
-        i = 0
-        while i < len(timestamps) - 1:
-            start, end = timestamps[i][0].split("-", 1)
-            next_start, next_end = timestamps[i + 1][0].split("-", 1)
+    if max_consecutive is not None and max_consecutive <= 1 or len(detections) == 0:
+        return detections
+
+    # Group by species in order of first detection, each sorted by start time
+    _, first, label_rank = np.unique(detections["label"], return_index=True, return_inverse=True)
+    label_rank = np.argsort(np.argsort(first))[label_rank]
+    detections = detections[np.lexsort((detections["start"], label_rank))]
+    groups = np.split(np.arange(len(detections)), np.flatnonzero(np.diff(detections["label"])) + 1)
+
+    # Merge consecutive detections, one pass over each species
+    starts, ends, labels, scores = [], [], [], []
+    for group in groups:
+        label = int(detections["label"][group[0]])
+        g_start, g_end, g_score = (detections[c][group].tolist() for c in ("start", "end", "score"))
+        n = len(group)
 
-            if float(end) >= float(next_start):
-                # Merge detections
-                merged_scores = [timestamps[i][1], timestamps[i + 1][1]]
-                timestamps.pop(i)
-
-                while i < len(timestamps) - 1 and float(next_end) >= float(timestamps[i + 1][0].split("-", 1)[0]):
+        i = 0
+        while i < n:
+            # Check if end time of current detection is within the start time of the next detection
+            if i < n - 1 and g_end[i] >= g_start[i + 1]:
+                merged_scores = [g_score[i], g_score[i + 1]]
+                next_end = g_end[i + 1]
+                j = i + 2
+
+                while j < n and next_end >= g_start[j]:
                     if max_consecutive and len(merged_scores) >= max_consecutive:
                         break
-                    merged_scores.append(timestamps[i + 1][1])
-                    next_end = timestamps[i + 1][0].split("-", 1)[1]
-                    timestamps.pop(i + 1)
+                    merged_scores.append(g_score[j])
+                    next_end = g_end[j]
+                    j += 1
 
                 # Calculate mean of top 3 scores
-                top_3_scores = sorted(merged_scores, reverse=True)[:3]
-                merged_score = sum(top_3_scores) / len(top_3_scores)
+                top_3_scores = heapq.nlargest(3, merged_scores)
+                starts.append(g_start[i])
+                ends.append(next_end)
+                scores.append(sum(top_3_scores) / len(top_3_scores))
 
-                timestamps[i] = (f"{start}-{next_end}", merged_score)
+                # A merged detection is never merged again with the one after it
+                i = j
+            else:
+                starts.append(g_start[i])
+                ends.append(g_end[i])
+                scores.append(g_score[i])
+                i += 1
 
-            i += 1
+        labels.extend([label] * (len(starts) - len(labels)))
 
-        merged_results[label] = timestamps
+    return make_detections(starts, ends, labels, scores)
 
-    # Restore original format
-    results = {}
-    for label, timestamps in merged_results.items():
-        for timestamp, score in timestamps:
-            if timestamp not in results:
-                results[timestamp] = []
-            results[timestamp].append((label, score))
 
-    return results
+def sort_detections(detections: np.ndarray):
+    """Sorts the detections by segment.
 
-
-def get_sorted_timestamps(results: dict[str, list]):
-    """Sorts the results based on the segments.
+    Segments are ordered by start time; detections sharing a segment stay together,
+    in the order they were added.
 
     Args:
-        results: The dictionary with {segment: scores}.
+        detections: The detections, of DETECTION_DTYPE.
 
     Returns:
-        Returns the sorted list of segments and their scores.
+        The sorted detections.
     """
-    return sorted(results, key=lambda t: float(t.split("-", 1)[0]))
+    if len(detections) == 0:
+        return detections
+
+    # Segments starting at the same time keep the order in which they first appear
+    _, first, segment = np.unique(detections[["start", "end"]], return_index=True, return_inverse=True)
+    order = np.lexsort((np.arange(len(detections)), first[segment], detections["start"]))
+
+    return detections[order]
 
 
 def get_raw_audio_from_file(fpath: str, offset, duration):
@@ -580,23 +713,199 @@ def get_result_file_names(fpath: str):
     return result_names
 
 
-def analyze_file(item):
+def init_worker(config: dict):
     """
-    Analyzes an audio file and generates prediction results.
+    Initializes a worker process of the analysis pool.
+
+    Restores the configuration once per process, so tasks only need to carry file paths,
+    and loads the model before the first file arrives.
 
     Args:
-        item (tuple): A tuple containing the file path (str) and configuration settings.
+        config (dict): The configuration from cfg.get_config().
+    """
+    cfg.set_config(config)
+
+    try:
+        if cfg.CUSTOM_CLASSIFIER is not None:
+            model.load_custom_classifier()
+        else:
+            model.load_model()
+    except Exception as ex:
+        # Leave it to the first analyze_file call, which reports the error per file
+        utils.write_error_log(ex)
+
+
+def iter_file_windows(fpath: str, stats: dict | None = None):
+    """
+    Decodes an audio file once and yields its analysis windows in order.
+
+    Windows skipped by the energy gate are not yielded but still advance the timestamps.
+
+    Args:
+        fpath (str): The file path of the input file.
+        stats (dict, optional): If given, "windows" and "skipped" counts are added to it.
+
+    Yields:
+        tuple: ((start, end), chunk) with the window's timestamps in seconds of the original file.
+    """
+    duration = int(cfg.FILE_SPLITTING_DURATION / cfg.AUDIO_SPEED)
+    start, end = 0, cfg.SIG_LENGTH
+
+    # The file is decoded once, in consecutive slices of FILE_SPLITTING_DURATION
+    blocks = audio.stream_audio_file(
+        fpath, cfg.SAMPLE_RATE, duration, cfg.BANDPASS_FMIN, cfg.BANDPASS_FMAX, cfg.AUDIO_SPEED
+    )
+
+    for sig in blocks:
+        chunks = audio.split_signal(sig, cfg.SAMPLE_RATE, cfg.SIG_LENGTH, cfg.SIG_OVERLAP, cfg.SIG_MINLEN)
+
+        # Skip windows that do not stand out from the noise floor
+        keep = None
+        if cfg.ENERGY_GATE > 0:
+            keep = audio.energy_gate(chunks, cfg.ENERGY_GATE, cfg.ENERGY_GATE_PERCENTILE)
+
+        if stats is not None:
+            stats["windows"] = stats.get("windows", 0) + len(chunks)
+            stats["skipped"] = stats.get("skipped", 0) + (0 if keep is None else len(chunks) - int(np.count_nonzero(keep)))
+
+        for chunk_index, chunk in enumerate(chunks):
+            if keep is None or keep[chunk_index]:
+                yield (round(start * cfg.AUDIO_SPEED, 1), round(end * cfg.AUDIO_SPEED, 1)), chunk
+
+            # Advance start and end
+            start += cfg.SIG_LENGTH - cfg.SIG_OVERLAP
+            end = start + cfg.SIG_LENGTH
+
+
+_SPECIES_MASK = (None, None, None)
+
+
+def get_species_mask():
+    """
+    Returns a boolean mask over cfg.LABELS that is True for the labels in cfg.SPECIES_LIST,
+    or None if there is no species list.
+
+    The mask is rebuilt only when cfg.LABELS or cfg.SPECIES_LIST are replaced, e.g. by set_config.
+    """
+    global _SPECIES_MASK
+
+    labels, species_list, mask = _SPECIES_MASK
+
+    if labels is not cfg.LABELS or species_list is not cfg.SPECIES_LIST:
+        labels, species_list = cfg.LABELS, cfg.SPECIES_LIST
+        mask = None
+
+        if species_list:
+            allowed = set(species_list)
+            mask = np.fromiter((label in allowed for label in labels), dtype=bool, count=len(labels))
+
+        _SPECIES_MASK = (labels, species_list, mask)
+
+    return mask
+
+
+def select_predictions(p):
+    """
+    Selects the detections to report from a batch of prediction scores.
+
+    Applies the species list, then either keeps the TOP_N highest scores per window
+    or every score of at least MIN_CONFIDENCE, over the whole batch at once.
+
+    Args:
+        p: The prediction scores, shape (windows, labels).
 
     Returns:
-        dict or None: A dictionary of result file names if analysis is successful,
-                      None if the file is skipped or an error occurs.
-    Raises:
-        Exception: If there is an error in reading the audio file or saving the results.
+        tuple: (window_idx, class_idx, score) arrays, ordered by window and descending score.
     """
-    # Get file path and restore cfg
-    fpath: str = item[0]
-    cfg.set_config(item[1])
+    p = np.asarray(p)
+
+    if p.shape[1] != len(cfg.LABELS):
+        raise ValueError(f"Model returned {p.shape[1]} scores for {len(cfg.LABELS)} labels")
+
+    mask = get_species_mask()
+
+    if cfg.TOP_N:
+        # Labels outside the species list can never be among the top N
+        scores = np.where(mask, p, -np.inf) if mask is not None else p
+        k = min(cfg.TOP_N, p.shape[1] if mask is None else int(np.count_nonzero(mask)))
+
+        if k < p.shape[1]:
+            # A stable sort keeps the lower class index first on tied scores, so ties at the cut-off are reproducible
+            class_idx = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        else:
+            class_idx = np.broadcast_to(np.arange(p.shape[1]), p.shape)
+
+        window_idx = np.repeat(np.arange(len(p)), class_idx.shape[1])
+        class_idx = class_idx.ravel()
+    else:
+        hits = p >= cfg.MIN_CONFIDENCE
+
+        if mask is not None:
+            hits &= mask
+
+        window_idx, class_idx = np.nonzero(hits)
+
+    score = p[window_idx, class_idx]
+
+    # Highest score first, ties in label order like a stable sort
+    order = np.lexsort((class_idx, -score, window_idx))
+
+    return window_idx[order], class_idx[order], score[order]
+
+
+def add_predictions(detections: list, timestamps: list, p):
+    """
+    Selects the detections from a batch of prediction scores and adds them to a file's detections.
+
+    Args:
+        detections (list): The detection tables of the file so far, one per batch.
+        timestamps (list): The (start, end) of every predicted window.
+        p: The prediction scores, one row per window.
+    """
+    window_idx, class_idx, score = select_predictions(p)
+    segments = np.array(timestamps, dtype="f8").reshape(-1, 2)[window_idx]
+
+    detections.append(make_detections(segments[:, 0], segments[:, 1], class_idx, score))
+
+
+def finish_file(fpath: str, detections: list, result_file_names: dict, start_time, stats: dict):
+    """
+    Saves the detections of an analyzed file and reports the elapsed time.
+
+    Returns:
+        dict or None: The result file names, or None if saving failed.
+    """
+    try:
+        detections = np.concatenate(detections) if detections else np.empty(0, dtype=DETECTION_DTYPE)
+        save_result_files(detections, result_file_names, fpath)
+
+    except Exception as ex:
+        # Write error log
+        print(f"Error: Cannot save result for {fpath}.\n", flush=True)
+        utils.write_error_log(ex)
+
+        return None
 
+    delta_time = (datetime.datetime.now() - start_time).total_seconds()
+    if cfg.ENERGY_GATE > 0:
+        print(
+            f"Finished {fpath} in {delta_time:.2f} seconds, energy gate skipped {stats.get('skipped', 0)} of {stats.get('windows', 0)} windows",
+            flush=True,
+        )
+    else:
+        print(f"Finished {fpath} in {delta_time:.2f} seconds", flush=True)
+
+    return result_file_names
+
+
+def start_file(fpath: str):
+    """
+    Prepares the analysis of a file.
+
+    Returns:
+        dict or None: The result file names, plus the file's "audio" info (native sample rate,
+            duration and channels), or None if the file is skipped or cannot be read.
+    """
     result_file_names = get_result_file_names(fpath)
 
     if cfg.SKIP_EXISTING_RESULTS:
@@ -604,18 +913,13 @@ def analyze_file(item):
             print(f"Skipping {fpath} as it has already been analyzed", flush=True)
             return None  # or return path to combine later? TODO
 
-    # Start time
-    start_time = datetime.datetime.now()
-    offset = 0
-    duration = int(cfg.FILE_SPLITTING_DURATION / cfg.AUDIO_SPEED)
-    start, end = 0, cfg.SIG_LENGTH
-    results = {}
-
     # Status
     print(f"Analyzing {fpath}", flush=True)
 
     try:
-        fileLengthSeconds = int(audio.get_audio_file_length(fpath) / cfg.AUDIO_SPEED)
+        # Header-only probe, so unreadable files are rejected before decoding starts.
+        # Kept for the result files and for combining, which then never re-open the audio.
+        result_file_names["audio"] = audio.get_audio_file_info(fpath)
     except Exception as ex:
         # Write error log
         print(f"Error: Cannot analyze audio file {fpath}. File corrupt?\n", flush=True)
@@ -623,59 +927,60 @@ def analyze_file(item):
 
         return None
 
-    # Process each chunk
-    try:
-        while offset < fileLengthSeconds:
-            chunks = get_raw_audio_from_file(fpath, offset, duration)
-            samples = []
-            timestamps = []
+    return result_file_names
+
 
-            for chunk_index, chunk in enumerate(chunks):
-                # Add to batch
-                samples.append(chunk)
-                timestamps.append([round(start * cfg.AUDIO_SPEED, 1), round(end * cfg.AUDIO_SPEED, 1)])
+def analyze_file(item):
+    """
+    Analyzes an audio file and generates prediction results.
 
-                # Advance start and end
-                start += cfg.SIG_LENGTH - cfg.SIG_OVERLAP
-                end = start + cfg.SIG_LENGTH
+    Args:
+        item (tuple): A tuple containing the file path (str) and configuration settings.
+            The settings may be None if the worker was set up with init_worker.
 
-                # Check if batch is full or last chunk
-                if len(samples) < cfg.BATCH_SIZE and chunk_index < len(chunks) - 1:
-                    continue
+    Returns:
+        dict or None: A dictionary of result file names (and the file's "audio" info) if analysis is successful,
+                      None if the file is skipped or an error occurs.
+    Raises:
+        Exception: If there is an error in reading the audio file or saving the results.
+    """
+    # Get file path and restore cfg
+    fpath: str = item[0]
+    if item[1] is not None:
+        cfg.set_config(item[1])
 
-                # Predict
-                p = predict(samples)
+    # Start time
+    start_time = datetime.datetime.now()
 
-                # Add to results
-                for i in range(len(samples)):
-                    # Get timestamp
-                    s_start, s_end = timestamps[i]
+    result_file_names = start_file(fpath)
+    if result_file_names is None:
+        return None
 
-                    # Get prediction
-                    pred = p[i]
+    detections = []
+    stats = {}
+    samples = []
+    timestamps = []
 
-                    # Assign scores to labels
-                    p_labels = [
-                        p
-                        for p in zip(cfg.LABELS, pred, strict=True)
-                        if (cfg.TOP_N or p[1] >= cfg.MIN_CONFIDENCE)
-                        and (not cfg.SPECIES_LIST or p[0] in cfg.SPECIES_LIST)
-                    ]
+    # Process each chunk
+    try:
+        for timestamp, chunk in iter_file_windows(fpath, stats):
+            # Add to batch
+            samples.append(chunk)
+            timestamps.append(timestamp)
 
-                    # Sort by score
-                    p_sorted = sorted(p_labels, key=operator.itemgetter(1), reverse=True)
+            # Check if batch is full
+            if len(samples) < cfg.BATCH_SIZE:
+                continue
 
-                    if cfg.TOP_N:
-                        p_sorted = p_sorted[: cfg.TOP_N]
+            add_predictions(detections, timestamps, predict(samples))
 
-                    # TODO hier schon top n oder min conf raussortieren
-                    # Store top 5 results and advance indices
-                    results[str(s_start) + "-" + str(s_end)] = p_sorted
+            # Clear batch
+            samples = []
+            timestamps = []
 
-                # Clear batch
-                samples = []
-                timestamps = []
-            offset = offset + duration
+        # Last, partial batch
+        if samples:
+            add_predictions(detections, timestamps, predict(samples))
 
     except Exception as ex:
         # Write error log
@@ -684,18 +989,113 @@ def analyze_file(item):
 
         return None
 
-    # Save as selection table
-    try:
-        save_result_files(results, result_file_names, fpath)
+    return finish_file(fpath, detections, result_file_names, start_time, stats)
 
-    except Exception as ex:
-        # Write error log
-        print(f"Error: Cannot save result for {fpath}.\n", flush=True)
-        utils.write_error_log(ex)
 
-        return None
+def analyze_files_batched(items: list):
+    """
+    Analyzes many files with inference batches that span file boundaries.
 
-    delta_time = (datetime.datetime.now() - start_time).total_seconds()
-    print(f"Finished {fpath} in {delta_time:.2f} seconds", flush=True)
+    With short clips, analyze_file rarely fills a batch, so most model calls run on one to three windows.
+    Here a producer thread decodes the files in order and packs their windows into full
+    BATCH_SIZE batches, each window tagged with its file and timestamp. The calling thread runs
+    inference on every batch and scatters the scores back to the per-file results. A file's
+    results are saved as soon as its last window has been predicted.
 
-    return result_file_names
+    Args:
+        items (list): Tuples of file path and configuration settings, as for analyze_file.
+
+    Returns:
+        list: The result file names of every item (None for skipped or failed files), in input order.
+    """
+    if items and items[0][1] is not None:
+        cfg.set_config(items[0][1])
+
+    files = [
+        {"path": item[0], "names": None, "detections": [], "stats": {}, "expected": None, "predicted": 0, "failed": False}
+        for item in items
+    ]
+    batches = queue.Queue(maxsize=4)
+
+    def produce():
+        samples, tags = [], []
+
+        try:
+            for file_index, f in enumerate(files):
+                f["start_time"] = datetime.datetime.now()
+                f["names"] = start_file(f["path"])
+                num_windows = 0
+
+                if f["names"] is not None:
+                    try:
+                        for timestamp, chunk in iter_file_windows(f["path"], f["stats"]):
+                            samples.append(chunk)
+                            tags.append((file_index, timestamp))
+                            num_windows += 1
+
+                            if len(samples) == cfg.BATCH_SIZE:
+                                batches.put((samples, tags))
+                                samples, tags = [], []
+                    except Exception as ex:
+                        print(f"Error: Cannot analyze audio file {f['path']}.\n", flush=True)
+                        utils.write_error_log(ex)
+                        batches.put(("failed", file_index))
+
+                # Some of its windows may still wait in the partially filled batch
+                batches.put(("done", file_index, num_windows))
+
+            if samples:
+                batches.put((samples, tags))
+        finally:
+            batches.put(None)
+
+    def finish(f):
+        if f["names"] is None or f["failed"]:
+            return None
+
+        return finish_file(f["path"], f["detections"], f["names"], f["start_time"], f["stats"])
+
+    result_files = [None] * len(files)
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+
+    def finish_if_complete(file_index):
+        f = files[file_index]
+
+        if f["expected"] is not None and f["predicted"] == f["expected"]:
+            result_files[file_index] = finish(f)
+
+    while (batch := batches.get()) is not None:
+        if batch[0] == "failed":
+            files[batch[1]]["failed"] = True
+            continue
+
+        if batch[0] == "done":
+            files[batch[1]]["expected"] = batch[2]
+            finish_if_complete(batch[1])
+            continue
+
+        samples, tags = batch
+        file_indices = sorted({file_index for file_index, _ in tags})
+        rows = {file_index: [i for i, (fi, _) in enumerate(tags) if fi == file_index] for file_index in file_indices}
+
+        try:
+            p = predict(samples)
+
+            # Scatter the scores back to their files
+            for file_index in file_indices:
+                add_predictions(files[file_index]["detections"], [tags[i][1] for i in rows[file_index]], p[rows[file_index]])
+        except Exception as ex:
+            print(f"Error: Cannot analyze audio files {[files[i]['path'] for i in file_indices]}.\n", flush=True)
+            utils.write_error_log(ex)
+
+            for file_index in file_indices:
+                files[file_index]["failed"] = True
+
+        for file_index in file_indices:
+            files[file_index]["predicted"] += len(rows[file_index])
+            finish_if_complete(file_index)
+
+    producer.join()
+
+    return result_files
@@ -1,11 +1,13 @@
 """Module containing audio helper functions."""
 
+import audioread
 import librosa
 import numpy as np
 import soundfile as sf
 from scipy.signal import firwin, kaiserord, lfilter, find_peaks
 
 import birdnet_analyzer.config as cfg
+from birdnet_analyzer.windows import noise_floor_gate, sliding_windows, window_energy
 
 RANDOM = np.random.RandomState(cfg.RANDOM_SEED)
 
@@ -49,19 +51,110 @@ def open_audio_file(path: str, sample_rate=48000, offset=0.0, duration=None, fmi
     return sig, rate
 
 
+def stream_audio_file(path: str, sample_rate=48000, block_duration=600, fmin=None, fmax=None, speed=1.0):
+    """Decode an audio file once and yield it block by block.
+
+    Reading consecutive slices with open_audio_file re-opens the file for every slice,
+    and compressed formats are decoded from the start again to reach each offset.
+    This reader opens the file once and decodes it sequentially. Every block is resampled
+    and filtered on its own, the same way open_audio_file treats a slice.
+    Formats that soundfile cannot read (e.g. m4a, aac, wma) are decoded through a single audioread
+    pipe, the backend librosa falls back to, so memory stays bounded by one block for those as well.
+
+    Args:
+        path: Path to the audio file.
+        sample_rate: The sample rate at which the file should be processed.
+        block_duration: Length of each block in seconds of the source file.
+        fmin: Minimum frequency for bandpass filter.
+        fmax: Maximum frequency for bandpass filter.
+        speed: Speed factor for audio playback.
+
+    Yields:
+        The mono signal of each block at sample_rate; the last block may be shorter.
+    """
+
+    def process(sig, rate):
+        sig = librosa.resample(sig, orig_sr=int(rate * speed), target_sr=sample_rate, res_type="kaiser_fast")
+
+        if fmin is not None and fmax is not None:
+            sig = bandpass(sig, sample_rate, fmin, fmax)
+
+        return sig
+
+    try:
+        f = sf.SoundFile(path)
+    except RuntimeError:
+        # Not readable by libsndfile, decode the file once with audioread and cut the stream into blocks
+        with audioread.audio_open(path) as f:
+            block_size = int(block_duration * f.samplerate) * f.channels
+            chunks, size = [], 0
+
+            for data in f:
+                chunks.append(librosa.util.buf_to_float(data, dtype=np.float32))
+                size += len(chunks[-1])
+
+                if size < block_size:
+                    continue
+
+                samples = np.concatenate(chunks)
+                end = size - size % block_size
+
+                for start in range(0, end, block_size):
+                    block = samples[start : start + block_size].reshape(-1, f.channels)
+                    yield process(block.mean(axis=1), f.samplerate)
+
+                chunks, size = [samples[end:]], size - end
+
+            if size:
+                block = np.concatenate(chunks).reshape(-1, f.channels)
+                yield process(block.mean(axis=1), f.samplerate)
+
+        return
+
+    with f:
+        for block in f.blocks(blocksize=int(block_duration * f.samplerate), dtype="float32", always_2d=True):
+            yield process(block.mean(axis=1), f.samplerate)
+
+
 def get_audio_file_length(path):
     """
     Get the length of an audio file in seconds.
 
+    Only the file header is read where possible;
+    formats that soundfile cannot read fall back to librosa.
+
     Args:
         path (str): The file path to the audio file.
 
     Returns:
         float: The duration of the audio file in seconds.
     """
-    # Open file with librosa (uses ffmpeg or libav)
+    try:
+        return sf.info(path).duration
+    except RuntimeError:
+        # Open file with librosa (uses ffmpeg or libav)
+        return librosa.get_duration(path=path, sr=None)
+
+
+def get_audio_file_info(path: str):
+    """
+    Get the native sample rate, duration and channel count of an audio file.
+
+    Only the file header is read where possible;
+    formats that soundfile cannot read fall back to librosa, without a channel count.
+
+    Args:
+        path (str): The file path to the audio file.
+
+    Returns:
+        dict: "sample_rate" (int), "duration" (float, seconds) and "channels" (int or None).
+    """
+    try:
+        info = sf.info(path)
 
-    return librosa.get_duration(filename=path, sr=None)
+        return {"sample_rate": info.samplerate, "duration": info.duration, "channels": info.channels}
+    except RuntimeError:
+        return {"sample_rate": librosa.get_samplerate(path), "duration": librosa.get_duration(path=path), "channels": None}
 
 
 def get_sample_rate(path: str):
@@ -129,6 +222,8 @@ def pad(sig, seconds, srate, amount=None):
 def split_signal(sig, rate, seconds, overlap, minlen, amount=None):
     """Split signal with overlap.
 
+    The splits are read-only views into the signal, only the padded tail is a copy.
+
     Args:
         sig: The original signal to be split.
         rate: The sampling rate.
@@ -159,35 +254,23 @@ def split_signal(sig, rate, seconds, overlap, minlen, amount=None):
     stepsize = int(rate * (seconds - overlap))
     minsize = int(rate * minlen)
 
-    # Start of last chunk
-    lastchunkpos = int((sig.size - chunksize + stepsize - 1) / stepsize) * stepsize
-    # Make sure at least one chunk is returned
-    if lastchunkpos < 0:
-        lastchunkpos = 0
-    # Omit last chunk if minimum signal duration is underrun
-    elif sig.size - lastchunkpos < minsize:
-        lastchunkpos = lastchunkpos - stepsize
-
-    # Append noise or empty signal of chunk duration, so all splits have desired length
+    # Noise or empty signal to pad the last chunk, so all splits have desired length
     if not cfg.USE_NOISE:
-        noise = np.zeros(shape=chunksize, dtype=sig.dtype)
+        noise = None
     else:
         # Random noise intensity
         if amount is None:
             amount = RANDOM.uniform(0.1, 0.5)
         # Create Gaussian noise
         try:
-            noise = RANDOM.normal(loc=min(sig) * amount, scale=max(sig) * amount, size=chunksize).astype(sig.dtype)
+            noise = RANDOM.normal(loc=np.min(sig) * amount, scale=np.max(sig) * amount, size=chunksize)
+            noise = noise.astype(sig.dtype)
         except:
-            noise = np.zeros(shape=chunksize, dtype=sig.dtype)
-    data = np.concatenate((sig, noise))
+            noise = None
 
-    # Split signal with overlap
-    sig_splits = []
-    for i in range(0, 1 + lastchunkpos, stepsize):
-        sig_splits.append(data[i : i + chunksize])
+    body, tail = sliding_windows(sig, chunksize, stepsize, minsize, noise)
 
-    return sig_splits
+    return [*body, *tail]
 
 
 def crop_center(sig, rate, seconds):
@@ -245,14 +328,7 @@ def smart_crop_signal(sig, rate, sig_length, sig_overlap, sig_minlen):
         return splits
     
     # Calculate energy for each window
-    energies = []
-    for split in splits:
-        # Calculate RMS energy
-        energy = np.sqrt(np.mean(split**2))
-        # Also consider peak values
-        peak = np.max(np.abs(split))
-        # Combine both metrics
-        energies.append(energy * 0.7 + peak * 0.3)  # Weighted combination
+    energies = window_energy(splits)
     
     # Find peaks in the energy curve
     # Smooth energies first to avoid small fluctuations
@@ -278,6 +354,29 @@ def smart_crop_signal(sig, rate, sig_length, sig_overlap, sig_minlen):
     return peak_splits
 
 
+def energy_gate(windows, factor, percentile=10, min_windows=10):
+    """Find the windows that stand out from the noise floor.
+
+    The noise floor is the given percentile of all window energies, so it adapts to each recording.
+    With fewer than min_windows windows there is no reliable floor and every window is kept.
+
+    Args:
+        windows: A 2-D array or a list of equally long windows.
+        factor: Windows need an energy above factor times the noise floor.
+        percentile: Percentile of the window energies used as noise floor.
+        min_windows: Minimum number of windows needed to estimate the floor.
+
+    Returns:
+        A boolean array, True for the windows that should be analyzed.
+    """
+    if len(windows) < min_windows:
+        return np.ones(len(windows), dtype=bool)
+
+    energies = window_energy(windows)
+
+    return noise_floor_gate(energies, energies, factor, percentile, min_windows)
+
+
 def bandpass(sig, rate, fmin, fmax, order=5):
     """
     Apply a bandpass filter to the input signal.
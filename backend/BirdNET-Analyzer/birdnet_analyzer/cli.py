@@ -305,6 +305,10 @@ def analyzer_parser():
         --skip_existing_results: Skips files that have already been analyzed if set.
         --top_n: Saves only the top N predictions for each segment. Threshold will be ignored.
         --merge_consecutive: Maximum number of consecutive detections to merge for each species.
+        --energy_gate: Skips segments below this multiple of the noise floor. 0 disables the gate.
+        --cross_file_batching: Fills inference batches with segments from several files.
+        --threaded: Analyzes files in threads of a single process instead of separate processes.
+        --species_cache_dir: Folder that keeps location filter results across runs.
     Returns:
         argparse.ArgumentParser: Configured argument parser for the BirdNET Analyzer CLI.
     """
@@ -370,6 +374,31 @@ def analyzer_parser():
         help="Maximum number of consecutive detections above MIN_CONF to merge for each detected species. This will result in fewer entires in the result file with segments longer than 3 seconds. Set to 0 or 1 to disable merging. Set to None to include all consecutive detections. We use the mean of the top 3 scores from all consecutive detections for merging.",
     )
 
+    parser.add_argument(
+        "--energy_gate",
+        type=lambda a: max(0.0, float(a)),
+        default=cfg.ENERGY_GATE,
+        help="Skip segments whose RMS/peak energy is not above this multiple of the recording's noise floor. The number of skipped segments is reported per file. Set to 0 to analyze every segment.",
+    )
+
+    parser.add_argument(
+        "--cross_file_batching",
+        action="store_true",
+        help="Fill each batch of --batch_size segments with segments from consecutive files instead of one file at a time. Speeds up folders of short clips. Runs a single analysis process that uses all --threads for inference.",
+    )
+
+    parser.add_argument(
+        "--threaded",
+        action="store_true",
+        help="Analyze files in --threads threads of a single process instead of --threads processes. The threads share one copy of the model weights, which saves memory.",
+    )
+
+    parser.add_argument(
+        "--species_cache_dir",
+        default=cfg.SPECIES_MASK_CACHE_DIR,
+        help="Folder that keeps the location filter results for --lat/--lon/--week across runs. Coordinates are rounded to 2 decimals.",
+    )
+
     return parser
 
 
@@ -548,6 +577,7 @@ def species_parser():
     The parser includes the following arguments:
     - output: Path to the output file or folder. If a folder is provided, the file will be named 'species_list.txt'.
     - --sortby: Optional argument to sort species by occurrence frequency ('freq') or alphabetically ('alpha'). Defaults to 'freq'.
+    - --species_cache_dir: Optional folder that keeps location filter results across runs.
     Returns:
         argparse.ArgumentParser: Configured argument parser for species retrieval.
     """
@@ -568,6 +598,49 @@ def species_parser():
         help="Sort species by occurrence frequency or alphabetically. Values in ['freq', 'alpha'].",
     )
 
+    parser.add_argument(
+        "--species_cache_dir",
+        default=cfg.SPECIES_MASK_CACHE_DIR,
+        help="Folder that keeps the location filter results across runs. Coordinates are rounded to 2 decimals.",
+    )
+
+    return parser
+
+
+def atlas_parser():
+    """
+    Creates an argument parser for precomputing a global species atlas with BirdNET.
+    The parser includes the following arguments:
+    - output: Path to the atlas file.
+    - --resolution: Grid cell size in degrees.
+    - --sf_thresh: Minimum species occurrence frequency threshold.
+    - --batch_size: Number of cells and weeks per model invoke.
+    - --threads: Number of CPU threads for the metadata model.
+    Returns:
+        argparse.ArgumentParser: Configured argument parser for building a species atlas.
+    """
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        parents=[threads_args(), bs_args(4096)],
+    )
+    parser.add_argument(
+        "output",
+        metavar="OUTPUT",
+        help="Path to the atlas file.",
+    )
+    parser.add_argument(
+        "--resolution",
+        type=lambda a: max(0.1, min(10.0, float(a))),
+        default=2.0,
+        help="Grid cell size in degrees. Values in [0.1, 10]. The file holds about 49 * 816 bytes per cell, i.e. 650 MB at 2 degrees and 2.6 GB at 1 degree.",
+    )
+    parser.add_argument(
+        "--sf_thresh",
+        type=lambda a: max(0.0001, min(0.99, float(a))),
+        default=cfg.LOCATION_FILTER_THRESHOLD,
+        help="Minimum species occurrence frequency threshold for location filter. Values in [0.0001, 0.99].",
+    )
+
     return parser
 
 
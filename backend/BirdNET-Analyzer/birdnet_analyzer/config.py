@@ -63,6 +63,16 @@ LONGITUDE: float = -1
 WEEK: int = -1
 LOCATION_FILTER_THRESHOLD: float = 0.03
 
+# Species lists are cached per location and week, with coordinates rounded to this many decimals.
+# The metadata model is evaluated at the rounded location, 2 decimals are about 1 km.
+LOCATION_CACHE_DECIMALS: int = 2
+
+# Number of species masks kept in memory
+SPECIES_MASK_CACHE_SIZE: int = 256
+
+# Folder for metadata model scores that persist across runs. Set to None to disable.
+SPECIES_MASK_CACHE_DIR: str | None = None
+
 ######################
 # Inference settings #
 ######################
@@ -101,6 +111,20 @@ MERGE_CONSECUTIVE: int = 1
 BATCH_SIZE: int = 1
 
 
+# Skip windows whose RMS/peak energy is not above ENERGY_GATE times the adaptive noise floor,
+# i.e. the ENERGY_GATE_PERCENTILE-th percentile of all window energies in the file segment.
+# Set to 0 to run the model on every window.
+ENERGY_GATE: float = 0
+ENERGY_GATE_PERCENTILE: float = 10
+
+# Pack windows of consecutive files into the same inference batch.
+# Useful for folders of short clips, which otherwise rarely fill a batch of BATCH_SIZE.
+CROSS_FILE_BATCHING: bool = False
+
+# Analyze files in CPU_THREADS threads of one process instead of CPU_THREADS processes.
+# Each thread runs its own interpreter, the model weights are shared.
+THREADED_ANALYSIS: bool = False
+
 # Number of seconds to load from a file at a time
 # Files will be loaded into memory in segments that are only as long as this value
 # Lowering this value results in lower memory usage
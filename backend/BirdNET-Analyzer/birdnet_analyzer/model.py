@@ -2,6 +2,7 @@
 
 import os
 import sys
+import threading
 import warnings
 
 import numpy as np
@@ -27,11 +28,9 @@ except ModuleNotFoundError:
 if not cfg.MODEL_PATH.endswith(".tflite"):
     from tensorflow import keras
 
-INTERPRETER: tflite.Interpreter = None
-C_INTERPRETER: tflite.Interpreter = None
-M_INTERPRETER: tflite.Interpreter = None
+MODEL: "BirdNETModel" = None
+MODEL_LOCK = threading.Lock()
 PBMODEL = None
-C_PBMODEL = None
 EMPTY_CLASS_EXCEPTION_REF = None
 
 def get_empty_class_exception():
@@ -485,98 +484,366 @@ def save_model_params(path):
     )
 
 
-def reset_custom_classifier():
-    """
-    Resets the custom classifier by setting the global variables C_INTERPRETER and C_PBMODEL to None.
-    This function is used to clear any existing custom classifier models and interpreters, effectively
-    resetting the state of the custom classifier.
-    """
-    global C_INTERPRETER
-    global C_PBMODEL
+def resize_input(interpreter, input_index, shape, allocated_shape):
+    """Resizes an input tensor and reallocates the interpreter, but only when the shape changes.
 
-    C_INTERPRETER = None
-    C_PBMODEL = None
+    Reallocating is expensive compared with inference on small batches, so the interpreter
+    keeps its tensors as long as consecutive calls use the same batch shape.
 
+    Args:
+        interpreter: The TFLite interpreter.
+        input_index: Index of the input tensor.
+        shape: The shape of the next input batch.
+        allocated_shape: The shape the interpreter is currently allocated for.
 
-def load_model(class_output=True):
+    Returns:
+        The shape the interpreter is allocated for after the call.
     """
-    Loads the machine learning model based on the configuration provided.
-    This function loads either a TensorFlow Lite (TFLite) model or a protobuf model
-    depending on the file extension of the model path specified in the configuration.
-    It sets up the global variables for the model interpreter and input/output layer indices.
+    shape = tuple(shape)
+
+    if shape != allocated_shape:
+        interpreter.resize_tensor_input(input_index, list(shape))
+        interpreter.allocate_tensors()
+
+    return shape
+
+
+class TFLiteRunner:
+    """A TFLite interpreter together with its input and output tensor indices.
+
+    Interpreters are not thread-safe, BirdNETModel keeps one runner per thread and model.
 
     Args:
-        class_output (bool): If True, sets the output layer index to the classification output.
-                             If False, sets the output layer index to the feature embeddings.
+        model_path: Path to the .tflite file.
+        num_threads: Number of threads of the interpreter.
     """
-    global PBMODEL
-    global INTERPRETER
-    global INPUT_LAYER_INDEX
-    global OUTPUT_LAYER_INDEX
 
-    # Do we have to load the tflite or protobuf model?
-    if cfg.MODEL_PATH.endswith(".tflite"):
+    def __init__(self, model_path: str, num_threads: int):
         # Load TFLite model and allocate tensors.
-        INTERPRETER = tflite.Interpreter(
-            model_path=os.path.join(SCRIPT_DIR, cfg.MODEL_PATH), num_threads=cfg.TFLITE_THREADS
-        )
-        INTERPRETER.allocate_tensors()
+        self.interpreter = tflite.Interpreter(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
 
         # Get input and output tensors.
-        input_details = INTERPRETER.get_input_details()
-        output_details = INTERPRETER.get_output_details()
+        input_details = self.interpreter.get_input_details()
+        output_details = self.interpreter.get_output_details()
+
+        self.input_index = input_details[0]["index"]
+        self.input_shape = tuple(input_details[0]["shape"])
+        self.input_size = input_details[0]["shape"][-1]
+        self.output_index = output_details[0]["index"]
+
+    def invoke(self, sample):
+        """Runs the interpreter on a batch, reallocating only when the batch shape changed.
+
+        Args:
+            sample: The input batch.
+        """
+        data = np.array(sample, dtype="float32")
+
+        self.input_shape = resize_input(self.interpreter, self.input_index, data.shape, self.input_shape)
+        self.interpreter.set_tensor(self.input_index, data)
+        self.interpreter.invoke()
+
+    def get_output(self, index=None):
+        """Returns a copy of an output tensor of the last invoke, by default the first model output."""
+        return self.interpreter.get_tensor(self.output_index if index is None else index)
+
+
+class BirdNETModel:
+    """Handle for the BirdNET models that can be used from several threads at once.
+
+    Each thread that uses the handle gets its own interpreters, created on first use with
+    num_threads threads each. TFLite maps the model files read-only, so the weights are shared
+    by all interpreters of the process instead of being copied per thread.
+
+    Args:
+        model_path: Path to the BirdNET model, .tflite or protobuf. Defaults to cfg.MODEL_PATH.
+        custom_classifier: Path to a custom classifier, .tflite or SavedModel. Defaults to None.
+        mdata_model_path: Path to the metadata model. Defaults to cfg.MDATA_MODEL_PATH.
+        num_threads: Number of threads per interpreter. Defaults to cfg.TFLITE_THREADS.
+    """
+
+    def __init__(self, model_path=None, custom_classifier=None, mdata_model_path=None, num_threads=None):
+        self.model_path = os.path.join(SCRIPT_DIR, model_path or cfg.MODEL_PATH)
+        self.custom_classifier = custom_classifier
+        self.mdata_model_path = os.path.join(SCRIPT_DIR, mdata_model_path or cfg.MDATA_MODEL_PATH)
+        self.num_threads = num_threads or cfg.TFLITE_THREADS
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pbmodel = None
+        self._c_pbmodel = None
+        self._custom_version = 0
+
+    def _runner(self, name: str, model_path: str, version: int = 0) -> TFLiteRunner:
+        """Returns the calling thread's runner for a model, creating it on first use or when outdated."""
+        runners = getattr(self._local, "runners", None)
+
+        if runners is None:
+            runners = self._local.runners = {}
+
+        entry = runners.get(name)
+
+        if entry is None or entry[0] != version:
+            entry = runners[name] = (version, TFLiteRunner(model_path, self.num_threads))
+
+        return entry[1]
+
+    def _main_runner(self) -> TFLiteRunner:
+        return self._runner("main", self.model_path)
+
+    def _custom_runner(self) -> TFLiteRunner:
+        return self._runner("custom", self.custom_classifier, self._custom_version)
 
-        # Get input tensor index
-        INPUT_LAYER_INDEX = input_details[0]["index"]
+    def _protobuf_model(self):
+        """Returns the protobuf model, loaded once and shared by all threads."""
+        with self._lock:
+            if self._pbmodel is None:
+                from tensorflow import keras
 
-        # Get classification output or feature embeddings
-        if class_output:
-            OUTPUT_LAYER_INDEX = output_details[0]["index"]
+                # Note: This will throw a bunch of warnings about custom gradients
+                # which we will ignore until TF lets us block them
+                self._pbmodel = keras.models.load_model(self.model_path, compile=False)
+
+            return self._pbmodel
+
+    def _saved_model_classifier(self):
+        """Returns the SavedModel custom classifier, loaded once and shared by all threads."""
+        with self._lock:
+            if self._c_pbmodel is None:
+                import tensorflow as tf
+
+                tf.get_logger().setLevel("ERROR")
+
+                self._c_pbmodel = tf.saved_model.load(self.custom_classifier)
+
+            return self._c_pbmodel
+
+    def set_custom_classifier(self, custom_classifier):
+        """Switches to another custom classifier, or back to the main net with None.
+
+        Interpreters of the previous classifier are replaced on their thread's next call.
+
+        Args:
+            custom_classifier: Path to a custom classifier, .tflite or SavedModel.
+        """
+        with self._lock:
+            self.custom_classifier = custom_classifier
+            self._c_pbmodel = None
+            self._custom_version += 1
+
+    def reset_custom_classifier(self):
+        """Reloads the custom classifier from disk on the next call of each thread."""
+        self.set_custom_classifier(self.custom_classifier)
+
+    def load(self):
+        """Loads the models the handle predicts with for the calling thread, e.g. before the first file."""
+        if self.custom_classifier is not None:
+            self.load_custom_classifier()
+        elif self.model_path.endswith(".tflite"):
+            self._main_runner()
         else:
-            OUTPUT_LAYER_INDEX = output_details[0]["index"] - 1
+            self._protobuf_model()
 
-    else:
-        # Load protobuf model
-        # Note: This will throw a bunch of warnings about custom gradients
-        # which we will ignore until TF lets us block them
-        PBMODEL = keras.models.load_model(os.path.join(SCRIPT_DIR, cfg.MODEL_PATH), compile=False)
+    def load_custom_classifier(self):
+        """Loads the custom classifier for the calling thread."""
+        if self.custom_classifier.endswith(".tflite"):
+            self._custom_runner()
+        else:
+            self._saved_model_classifier()
 
+    def load_meta_model(self):
+        """Loads the model for species prediction for the calling thread."""
+        self._runner("meta", self.mdata_model_path)
 
-def load_custom_classifier():
+    def predict(self, sample):
+        """Predicts a sample with the custom classifier, if set, or the main net.
+
+        Args:
+            sample: Audio sample.
+
+        Returns:
+            The prediction scores for the sample.
+        """
+        # Has custom classifier?
+        if self.custom_classifier is not None:
+            return self.predict_with_custom_classifier(sample)
+
+        if not self.model_path.endswith(".tflite"):
+            # Make a prediction (Audio only for now)
+            return self._protobuf_model().basic(sample)["scores"]
+
+        runner = self._main_runner()
+        runner.invoke(sample)
+
+        return runner.get_output()
+
+    def predict_with_custom_classifier(self, sample, features=None):
+        """Uses the custom classifier to make a prediction.
+
+        Args:
+            sample: Audio sample.
+            features: Embeddings of the sample, if they were already extracted.
+                Saves a pass of the main net for classifiers that take embeddings as input.
+
+        Returns:
+            The prediction scores for the sample.
+        """
+        if not self.custom_classifier.endswith(".tflite"):
+            return self._saved_model_classifier().basic(sample)["scores"]
+
+        runner = self._custom_runner()
+
+        if runner.input_size == 144000:
+            vector = sample
+        else:
+            vector = features if features is not None else self.embeddings(sample)
+
+        runner.invoke(vector)
+
+        return runner.get_output()
+
+    def embeddings(self, sample):
+        """Extracts the embeddings for a sample.
+
+        Args:
+            sample: Audio samples.
+
+        Returns:
+            The embeddings.
+        """
+        runner = self._main_runner()
+        runner.invoke(sample)
+
+        # The embeddings are the tensor right before the classification output
+        return runner.get_output(runner.output_index - 1)
+
+    def predict_with_embeddings(self, sample):
+        """Predicts a sample and extracts its embeddings with a single pass of the main net.
+
+        Both the classification output and the feature embeddings are read after the same invoke().
+        With a custom classifier, the scores come from the custom classifier, which receives
+        the embeddings of this pass instead of running the main net again.
+
+        Args:
+            sample: Audio samples.
+
+        Returns:
+            A tuple of (prediction scores, embeddings).
+        """
+        runner = self._main_runner()
+        runner.invoke(sample)
+        features = runner.get_output(runner.output_index - 1)
+
+        if self.custom_classifier is not None:
+            return self.predict_with_custom_classifier(sample, features), features
+
+        return runner.get_output(), features
+
+    def predict_filter(self, lat, lon, week):
+        """Predicts the probability for each species.
+
+        Args:
+            lat: The latitude.
+            lon: The longitude.
+            week: The week of the year [1-48]. Use -1 for yearlong.
+
+        Returns:
+            A list of probabilities for all species.
+        """
+        runner = self._runner("meta", self.mdata_model_path)
+
+        # Prepare mdata as sample
+        runner.invoke(np.expand_dims(np.array([lat, lon, week], dtype="float32"), 0))
+
+        return runner.get_output()[0]
+
+    def predict_filter_many(self, lat, lon, week, batch_size=4096):
+        """Predicts the probability for each species at many locations and weeks.
+
+        Runs the metadata model on up to batch_size rows per invoke.
+
+        Args:
+            lat: The latitudes.
+            lon: The longitudes.
+            week: The weeks of the year [1-48]. Use -1 for yearlong.
+                All three are broadcast against each other.
+            batch_size: Number of rows per invoke.
+
+        Returns:
+            An array of shape (rows, species) with the probabilities.
+        """
+        runner = self._runner("meta", self.mdata_model_path)
+        samples = np.stack(np.broadcast_arrays(lat, lon, week), axis=-1).reshape(-1, 3).astype("float32")
+
+        if len(samples) == 0:
+            return np.empty((0, runner.interpreter.get_output_details()[0]["shape"][-1]), dtype="float32")
+
+        predictions = []
+
+        for i in range(0, len(samples), batch_size):
+            runner.invoke(samples[i : i + batch_size])
+            predictions.append(runner.get_output())
+
+        return np.concatenate(predictions)
+
+
+def get_model() -> BirdNETModel:
+    """Returns the default model handle used by the module functions.
+
+    The handle is created from the config on first use and follows changes of cfg.CUSTOM_CLASSIFIER.
+
+    Returns:
+        The shared BirdNETModel.
     """
-    Loads a custom classifier model based on the file extension of the provided model path.
-    If the model file ends with ".tflite", it loads a TensorFlow Lite model and sets up the interpreter,
-    input layer index, output layer index, and input size.
-    If the model file does not end with ".tflite", it loads a TensorFlow SavedModel.
+    global MODEL
+
+    with MODEL_LOCK:
+        if MODEL is None:
+            MODEL = BirdNETModel(custom_classifier=cfg.CUSTOM_CLASSIFIER)
+        elif MODEL.custom_classifier != cfg.CUSTOM_CLASSIFIER:
+            MODEL.set_custom_classifier(cfg.CUSTOM_CLASSIFIER)
+
+        return MODEL
+
+
+def reset_custom_classifier():
     """
-    global C_INTERPRETER
-    global C_INPUT_LAYER_INDEX
-    global C_OUTPUT_LAYER_INDEX
-    global C_INPUT_SIZE
-    global C_PBMODEL
+    Resets the custom classifier of the default model handle.
+    The classifier is loaded again from cfg.CUSTOM_CLASSIFIER on its next use, which makes it
+    possible to switch classifiers or pick up a retrained one.
+    """
+    if MODEL is not None:
+        MODEL.reset_custom_classifier()
 
-    if cfg.CUSTOM_CLASSIFIER.endswith(".tflite"):
-        # Load TFLite model and allocate tensors.
-        C_INTERPRETER = tflite.Interpreter(model_path=cfg.CUSTOM_CLASSIFIER, num_threads=cfg.TFLITE_THREADS)
-        C_INTERPRETER.allocate_tensors()
 
-        # Get input and output tensors.
-        input_details = C_INTERPRETER.get_input_details()
-        output_details = C_INTERPRETER.get_output_details()
+def load_model(class_output=True):
+    """
+    Loads the machine learning model based on the configuration provided.
+    Creates a new default model handle from the config, so changes of cfg.MODEL_PATH or
+    cfg.TFLITE_THREADS take effect, and loads the main net for the calling thread.
 
-        # Get input tensor index
-        C_INPUT_LAYER_INDEX = input_details[0]["index"]
+    Args:
+        class_output (bool): Kept for compatibility. The handle reads the classification output
+                             and the feature embeddings from the same interpreter.
+    """
+    global MODEL
 
-        C_INPUT_SIZE = input_details[0]["shape"][-1]
+    with MODEL_LOCK:
+        MODEL = BirdNETModel(custom_classifier=cfg.CUSTOM_CLASSIFIER)
 
-        # Get classification output
-        C_OUTPUT_LAYER_INDEX = output_details[0]["index"]
+    if MODEL.model_path.endswith(".tflite"):
+        MODEL._main_runner()
     else:
-        import tensorflow as tf
+        MODEL._protobuf_model()
 
-        tf.get_logger().setLevel("ERROR")
 
-        C_PBMODEL = tf.saved_model.load(cfg.CUSTOM_CLASSIFIER)
+def load_custom_classifier():
+    """
+    Loads the custom classifier of cfg.CUSTOM_CLASSIFIER for the calling thread.
+    A ".tflite" file is run by the TFLite interpreter, anything else is loaded as TensorFlow SavedModel.
+    """
+    get_model().load_custom_classifier()
 
 
 def load_meta_model():
@@ -584,23 +851,7 @@ def load_meta_model():
 
     Initializes the model used to predict species list, based on coordinates and week of year.
     """
-    global M_INTERPRETER
-    global M_INPUT_LAYER_INDEX
-    global M_OUTPUT_LAYER_INDEX
-
-    # Load TFLite model and allocate tensors.
-    M_INTERPRETER = tflite.Interpreter(
-        model_path=os.path.join(SCRIPT_DIR, cfg.MDATA_MODEL_PATH), num_threads=cfg.TFLITE_THREADS
-    )
-    M_INTERPRETER.allocate_tensors()
-
-    # Get input and output tensors.
-    input_details = M_INTERPRETER.get_input_details()
-    output_details = M_INTERPRETER.get_output_details()
-
-    # Get input tensor index
-    M_INPUT_LAYER_INDEX = input_details[0]["index"]
-    M_OUTPUT_LAYER_INDEX = output_details[0]["index"]
+    get_model().load_meta_model()
 
 
 def build_linear_classifier(num_labels, input_size, hidden_units=0, dropout=0.0):
@@ -1017,20 +1268,23 @@ def predict_filter(lat, lon, week):
     Returns:
         A list of probabilities for all species.
     """
-    global M_INTERPRETER
+    return get_model().predict_filter(lat, lon, week)
 
-    # Does interpreter exist?
-    if M_INTERPRETER is None:
-        load_meta_model()
 
-    # Prepare mdata as sample
-    sample = np.expand_dims(np.array([lat, lon, week], dtype="float32"), 0)
+def predict_filter_many(lat, lon, week, batch_size=4096):
+    """Predicts the probability for each species at many locations and weeks.
 
-    # Run inference
-    M_INTERPRETER.set_tensor(M_INPUT_LAYER_INDEX, sample)
-    M_INTERPRETER.invoke()
+    Args:
+        lat: The latitudes.
+        lon: The longitudes.
+        week: The weeks of the year [1-48]. Use -1 for yearlong.
+            All three are broadcast against each other.
+        batch_size: Number of rows per invoke.
 
-    return M_INTERPRETER.get_tensor(M_OUTPUT_LAYER_INDEX)[0]
+    Returns:
+        An array of shape (rows, species) with the probabilities.
+    """
+    return get_model().predict_filter_many(lat, lon, week, batch_size)
 
 
 def explore(lat: float, lon: float, week: int):
@@ -1151,69 +1405,21 @@ def predict(sample):
     Returns:
         The prediction scores for the sample.
     """
-    # Has custom classifier?
-    if cfg.CUSTOM_CLASSIFIER is not None:
-        return predict_with_custom_classifier(sample)
-
-    global INTERPRETER
-
-    # Does interpreter or keras model exist?
-    if INTERPRETER is None and PBMODEL is None:
-        load_model()
-
-    if PBMODEL is None:
-        # Reshape input tensor
-        INTERPRETER.resize_tensor_input(INPUT_LAYER_INDEX, [len(sample), *sample[0].shape])
-        INTERPRETER.allocate_tensors()
-
-        # Make a prediction (Audio only for now)
-        INTERPRETER.set_tensor(INPUT_LAYER_INDEX, np.array(sample, dtype="float32"))
-        INTERPRETER.invoke()
-        prediction = INTERPRETER.get_tensor(OUTPUT_LAYER_INDEX)
-
-        return prediction
-
-    else:
-        # Make a prediction (Audio only for now)
-        prediction = PBMODEL.basic(sample)["scores"]
+    return get_model().predict(sample)
 
-        return prediction
 
-
-def predict_with_custom_classifier(sample):
+def predict_with_custom_classifier(sample, features=None):
     """Uses the custom classifier to make a prediction.
 
     Args:
         sample: Audio sample.
+        features: Embeddings of the sample, if they were already extracted.
+            Saves a pass of the main net for classifiers that take embeddings as input.
 
     Returns:
         The prediction scores for the sample.
     """
-    global C_INTERPRETER
-    global C_INPUT_SIZE
-    global C_PBMODEL
-
-    # Does interpreter exist?
-    if C_INTERPRETER is None and C_PBMODEL is None:
-        load_custom_classifier()
-
-    if C_PBMODEL is None:
-        vector = embeddings(sample) if C_INPUT_SIZE != 144000 else sample
-
-        # Reshape input tensor
-        C_INTERPRETER.resize_tensor_input(C_INPUT_LAYER_INDEX, [len(vector), *vector[0].shape])
-        C_INTERPRETER.allocate_tensors()
-
-        # Make a prediction
-        C_INTERPRETER.set_tensor(C_INPUT_LAYER_INDEX, np.array(vector, dtype="float32"))
-        C_INTERPRETER.invoke()
-        prediction = C_INTERPRETER.get_tensor(C_OUTPUT_LAYER_INDEX)
-
-        return prediction
-    else:
-        prediction = C_PBMODEL.basic(sample)["scores"]
-
-        return prediction
+    return get_model().predict_with_custom_classifier(sample, features)
 
 
 def embeddings(sample):
@@ -1225,19 +1431,16 @@ def embeddings(sample):
     Returns:
         The embeddings.
     """
-    global INTERPRETER
+    return get_model().embeddings(sample)
 
-    # Does interpreter exist?
-    if INTERPRETER is None:
-        load_model(False)
 
-    # Reshape input tensor
-    INTERPRETER.resize_tensor_input(INPUT_LAYER_INDEX, [len(sample), *sample[0].shape])
-    INTERPRETER.allocate_tensors()
+def predict_with_embeddings(sample):
+    """Predicts a sample and extracts its embeddings with a single pass of the main net.
 
-    # Extract feature embeddings
-    INTERPRETER.set_tensor(INPUT_LAYER_INDEX, np.array(sample, dtype="float32"))
-    INTERPRETER.invoke()
-    features = INTERPRETER.get_tensor(OUTPUT_LAYER_INDEX)
+    Args:
+        sample: Audio samples.
 
-    return features
+    Returns:
+        A tuple of (prediction scores, embeddings).
+    """
+    return get_model().predict_with_embeddings(sample)
@@ -1,3 +1,3 @@
-from birdnet_analyzer.species.core import species
+from birdnet_analyzer.species.core import species, species_atlas
 
-__all__ = ["species"]
+__all__ = ["species", "species_atlas"]
@@ -0,0 +1,184 @@
+"""Module for precomputing species lists on a global grid.
+
+An atlas stores, for every cell of a lat/lon grid and every week, which species the
+metadata model considers plausible. Masks are bit-packed and memory-mapped at query time,
+so a lookup is an array index and does not load the model.
+
+File layout: the magic bytes, a little-endian uint32 header length, the JSON header,
+zero padding to ATLAS_ALIGNMENT and the uint8 mask array of shape
+(latitudes, longitudes, weeks, bytes per mask) in C order.
+"""
+
+import json
+import os
+import struct
+
+import numpy as np
+
+import birdnet_analyzer.config as cfg
+import birdnet_analyzer.model as model
+
+ATLAS_MAGIC = b"BNATLAS1"
+ATLAS_ALIGNMENT = 64
+
+# Week slot 0 holds the year-round list (week -1), slots 1 to 48 the weeks of the year
+ATLAS_WEEKS = np.array([-1, *range(1, 49)])
+
+
+def _data_offset(header_length: int) -> int:
+    return -(-(len(ATLAS_MAGIC) + 4 + header_length) // ATLAS_ALIGNMENT) * ATLAS_ALIGNMENT
+
+
+def grid_centers(resolution: float):
+    """Returns the latitudes and longitudes of the cell centres of a grid.
+
+    Args:
+        resolution: Cell size in degrees.
+
+    Returns:
+        A tuple (latitudes, longitudes) of arrays.
+    """
+    n_lat = int(np.ceil(180 / resolution))
+    n_lon = int(np.ceil(360 / resolution))
+
+    lats = np.minimum(-90 + (np.arange(n_lat) + 0.5) * resolution, 90)
+    lons = np.minimum(-180 + (np.arange(n_lon) + 0.5) * resolution, 180)
+
+    return lats, lons
+
+
+def build_atlas(output_path: str, resolution=2.0, threshold=0.03, batch_size=4096):
+    """Scores every grid cell and week with the metadata model and writes the atlas file.
+
+    Args:
+        output_path: Path of the atlas file.
+        resolution: Cell size in degrees.
+        threshold: Species with a score above or equal to threshold are marked as present.
+        batch_size: Number of cell/week rows per model invoke.
+    """
+    lats, lons = grid_centers(resolution)
+    num_classes = len(model.predict_filter(0, 0, -1))
+    shape = (len(lats), len(lons), len(ATLAS_WEEKS), (num_classes + 7) // 8)
+
+    header = json.dumps(
+        {
+            "version": 1,
+            "model": os.path.basename(cfg.MDATA_MODEL_PATH),
+            "resolution": resolution,
+            "threshold": threshold,
+            "num_classes": num_classes,
+            "shape": shape,
+        }
+    ).encode("utf-8")
+    offset = _data_offset(len(header))
+
+    # Write to a temporary file first, so readers never map a partial atlas
+    tmp_path = output_path + ".tmp"
+
+    with open(tmp_path, "wb") as f:
+        f.write(ATLAS_MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        f.truncate(offset + int(np.prod(shape)))
+
+    data = np.memmap(tmp_path, dtype=np.uint8, mode="r+", offset=offset, shape=shape)
+    rows = data.reshape(-1, shape[-1])
+
+    for start in range(0, len(rows), batch_size):
+        end = min(len(rows), start + batch_size)
+        lat_idx, lon_idx, week_idx = np.unravel_index(np.arange(start, end), shape[:3])
+
+        scores = model.predict_filter_many(lats[lat_idx], lons[lon_idx], ATLAS_WEEKS[week_idx], batch_size)
+        rows[start:end] = np.packbits(scores >= threshold, axis=1)
+
+        if lat_idx[-1] != lat_idx[0] or end == len(rows):
+            print(f"\r{end / len(rows):.0%} of {len(rows)} cells and weeks", end="", flush=True)
+
+    print(flush=True)
+
+    data.flush()
+    del rows, data
+
+    os.replace(tmp_path, output_path)
+
+
+class SpeciesAtlas:
+    """Read-only, memory-mapped view of an atlas file written by build_atlas().
+
+    Args:
+        path: Path of the atlas file.
+
+    Raises:
+        ValueError: If the file is not an atlas.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            if f.read(len(ATLAS_MAGIC)) != ATLAS_MAGIC:
+                raise ValueError(f"{path} is not a species atlas")
+
+            (header_length,) = struct.unpack("<I", f.read(4))
+            header = json.loads(f.read(header_length))
+
+        self.path = path
+        self.resolution = header["resolution"]
+        self.threshold = header["threshold"]
+        self.num_classes = header["num_classes"]
+        self.data = np.memmap(
+            path, dtype=np.uint8, mode="r", offset=_data_offset(header_length), shape=tuple(header["shape"])
+        )
+
+    def index(self, lat: float, lon: float, week: int):
+        """Returns the (latitude, longitude, week) index of the cell that contains a location.
+
+        Args:
+            lat: The latitude.
+            lon: The longitude.
+            week: The week of the year [1-48]. Use -1 for year-round.
+
+        Raises:
+            ValueError: If week is not -1 or in [1, 48].
+        """
+        if week != -1 and not 1 <= week <= 48:
+            raise ValueError(f"Week must be -1 or in [1, 48], got {week}")
+
+        n_lat, n_lon = self.data.shape[:2]
+        lat_idx = min(n_lat - 1, max(0, int((lat + 90) // self.resolution)))
+        lon_idx = int((lon + 180) // self.resolution) % n_lon
+
+        return lat_idx, lon_idx, max(0, int(week))
+
+    def get_mask(self, lat: float, lon: float, week: int) -> np.ndarray:
+        """Returns the boolean class mask for a location and week.
+
+        Args:
+            lat: The latitude.
+            lon: The longitude.
+            week: The week of the year [1-48]. Use -1 for year-round.
+
+        Returns:
+            A boolean array with one entry per model class.
+        """
+        return np.unpackbits(self.data[self.index(lat, lon, week)], count=self.num_classes).astype(bool)
+
+    def get_species_list(self, lat: float, lon: float, week: int, labels=None) -> list[str]:
+        """Returns the species present at a location and week, in label order.
+
+        Args:
+            lat: The latitude.
+            lon: The longitude.
+            week: The week of the year [1-48]. Use -1 for year-round.
+            labels: The class labels. Defaults to cfg.LABELS.
+
+        Returns:
+            A list of species.
+        """
+        labels = labels if labels is not None else cfg.LABELS
+
+        return [labels[i] for i in np.flatnonzero(self.get_mask(lat, lon, week))]
+
+
+if __name__ == "__main__":
+    from birdnet_analyzer.species.cli import atlas_main
+
+    atlas_main()
@@ -12,3 +12,16 @@ def main():
     args = parser.parse_args()
 
     species(**vars(args))
+
+
+@runtime_error_handler
+def atlas_main():
+    import birdnet_analyzer.cli as cli
+    from birdnet_analyzer.species.core import species_atlas
+
+    # Parse arguments
+    parser = cli.atlas_parser()
+
+    args = parser.parse_args()
+
+    species_atlas(**vars(args))
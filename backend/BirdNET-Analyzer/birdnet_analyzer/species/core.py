@@ -1,6 +1,40 @@
 from typing import Literal
 
 
+def species_atlas(
+    output: str,
+    *,
+    resolution: float = 2.0,
+    sf_thresh: float = 0.03,
+    batch_size: int = 4096,
+    threads: int = 8,
+):
+    """
+    Precomputes the species lists of a global lat/lon grid for every week and saves them as atlas file.
+    Args:
+        output (str): Path to the atlas file.
+        resolution (float, optional): Grid cell size in degrees. Defaults to 2.0.
+        sf_thresh (float, optional): Species frequency threshold for filtering. Defaults to 0.03.
+        batch_size (int, optional): Number of grid cells and weeks scored per model invoke. Defaults to 4096.
+        threads (int, optional): Number of CPU threads for the metadata model. Defaults to 8.
+    Notes:
+        The atlas can be queried with `birdnet_analyzer.species.atlas.SpeciesAtlas`.
+    """
+    import birdnet_analyzer.config as cfg
+    from birdnet_analyzer.species.atlas import build_atlas
+    from birdnet_analyzer.utils import ensure_model_exists
+
+    ensure_model_exists()
+
+    cfg.TFLITE_THREADS = threads
+
+    print(f"Building species atlas with {resolution} degree cells...", flush=True)
+
+    build_atlas(output, resolution, sf_thresh, batch_size)
+
+    print(f"Done. Atlas saved to {output}.", flush=True)
+
+
 def species(
     output: str,
     *,
@@ -9,6 +43,7 @@ def species(
     week: int = -1,
     sf_thresh: float = 0.03,
     sortby: Literal["freq", "alpha"] = "freq",
+    species_cache_dir: str | None = None,
 ):
     """
     Retrieves and processes species data based on the provided parameters.
@@ -20,6 +55,7 @@ def species(
         sf_thresh (float, optional): Species frequency threshold for filtering. Defaults to 0.03.
         sortby (Literal["freq", "alpha"], optional): Sorting method for the species list.
             "freq" sorts by frequency, and "alpha" sorts alphabetically. Defaults to "freq".
+        species_cache_dir (str | None, optional): Folder that keeps location filter results across runs. Defaults to None (no disk cache).
     Raises:
         FileNotFoundError: If the required model files are not found.
         ValueError: If invalid parameters are provided.
@@ -32,4 +68,4 @@ def species(
 
     ensure_model_exists()
 
-    run(output, lat, lon, week, sf_thresh, sortby)
+    run(output, lat, lon, week, sf_thresh, sortby, species_cache_dir)
@@ -3,13 +3,134 @@
 Can be used to predict a species list using coordinates and weeks.
 """
 
+import functools
 import os
 
+import numpy as np
+
 import birdnet_analyzer.config as cfg
 import birdnet_analyzer.model as model
 import birdnet_analyzer.utils as utils
 
 
+def quantize_location(lat: float, lon: float, week: int):
+    """Rounds coordinates to cfg.LOCATION_CACHE_DECIMALS, so nearby locations share a cache entry.
+
+    Args:
+        lat: The latitude.
+        lon: The longitude.
+        week: The week of the year [1-48]. Use -1 for year-round.
+
+    Returns:
+        A tuple (lat, lon, week).
+    """
+    return round(float(lat), cfg.LOCATION_CACHE_DECIMALS), round(float(lon), cfg.LOCATION_CACHE_DECIMALS), int(week)
+
+
+def get_location_scores(lat: float, lon: float, week: int) -> np.ndarray:
+    """Predicts the occurrence scores of all species with the metadata model.
+
+    If cfg.SPECIES_MASK_CACHE_DIR is set, the scores are read from and written to that folder,
+    so they persist across runs.
+
+    Args:
+        lat: The latitude.
+        lon: The longitude.
+        week: The week of the year [1-48]. Use -1 for year-round.
+
+    Returns:
+        The scores as float32 array.
+    """
+    cache_file = None
+
+    if cfg.SPECIES_MASK_CACHE_DIR:
+        model_name = os.path.splitext(os.path.basename(cfg.MDATA_MODEL_PATH))[0]
+        cache_file = os.path.join(cfg.SPECIES_MASK_CACHE_DIR, f"{model_name}_{lat}_{lon}_{week}.npy")
+
+        try:
+            return np.load(cache_file)
+        except (OSError, ValueError):
+            pass
+
+    scores = np.asarray(model.predict_filter(lat, lon, week), dtype=np.float32)
+
+    if cache_file:
+        os.makedirs(cfg.SPECIES_MASK_CACHE_DIR, exist_ok=True)
+
+        # Write to a temporary file first, so concurrent runs never read a partial file
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+
+        with open(tmp_file, "wb") as f:
+            np.save(f, scores)
+
+        os.replace(tmp_file, cache_file)
+
+    return scores
+
+
+# (cache size, lru_cache-wrapped _location_mask), rebuilt when cfg.SPECIES_MASK_CACHE_SIZE changes
+_LOCATION_MASK_CACHE = (None, None)
+
+
+def _location_mask(model_path: str, lat: float, lon: float, week: int, threshold: float, filter_threshold: float):
+    # model_path is only part of the cache key, get_location_scores() reads the model from the config
+    scores = get_location_scores(lat, lon, week)
+
+    # Same filtering as model.explore()
+    scores = np.where(scores >= filter_threshold, scores, 0)
+    mask = scores >= threshold
+
+    # Indices of the eligible species, by descending score
+    order = np.argsort(-scores, kind="stable")
+    order = order[mask[order]]
+
+    # The arrays are shared by all callers
+    mask.setflags(write=False)
+    order.setflags(write=False)
+
+    return mask, order
+
+
+def _cached_location_mask():
+    """Returns _location_mask wrapped in an LRU cache of the current cfg.SPECIES_MASK_CACHE_SIZE."""
+    global _LOCATION_MASK_CACHE
+
+    size, cached = _LOCATION_MASK_CACHE
+
+    if cached is None or size != cfg.SPECIES_MASK_CACHE_SIZE:
+        size = cfg.SPECIES_MASK_CACHE_SIZE
+        cached = functools.lru_cache(maxsize=size)(_location_mask)
+        _LOCATION_MASK_CACHE = (size, cached)
+
+    return cached
+
+
+def get_location_mask(lat: float, lon: float, week: int, threshold=0.05):
+    """Predicts which species are eligible at a location and week.
+
+    Results are kept in an LRU cache of cfg.SPECIES_MASK_CACHE_SIZE entries, keyed by the metadata model,
+    the rounded location, the week and the thresholds, see quantize_location().
+
+    Args:
+        lat: The latitude.
+        lon: The longitude.
+        week: The week of the year [1-48]. Use -1 for year-round.
+        threshold: Only species with a score above or equal to threshold are eligible.
+
+    Returns:
+        A tuple (mask, species) of a read-only boolean array over the model classes
+        and the list of eligible species, by descending score.
+    """
+    mask, order = _cached_location_mask()(
+        cfg.MDATA_MODEL_PATH,
+        *quantize_location(lat, lon, week),
+        float(threshold),
+        float(cfg.LOCATION_FILTER_THRESHOLD),
+    )
+
+    return mask, [cfg.LABELS[i] for i in order]
+
+
 def get_species_list(lat: float, lon: float, week: int, threshold=0.05, sort=False) -> list[str]:
     """Predict a species list.
 
@@ -25,16 +146,12 @@ def get_species_list(lat: float, lon: float, week: int, threshold=0.05, sort=Fal
     Returns:
         A list of all eligible species.
     """
-    # Extract species from model
-    pred = model.explore(lat, lon, week)
-
-    # Make species list
-    slist = [p[1] for p in pred if p[0] >= threshold]
+    _, slist = get_location_mask(lat, lon, week, threshold)
 
     return sorted(slist) if sort else slist
 
 
-def run(output_path, lat, lon, week, threshold, sortby):
+def run(output_path, lat, lon, week, threshold, sortby, cache_dir=None):
     """
     Generates a species list for a given location and time, and saves it to the specified output path.
     Args:
@@ -44,6 +161,7 @@ def run(output_path, lat, lon, week, threshold, sortby):
         week (int): Week of the year (1-52) for which the species list is generated.
         threshold (float): Threshold for location filtering.
         sortby (str): Sorting criteria for the species list. Can be "freq" for frequency or any other value for alphabetical sorting.
+        cache_dir (str, optional): Folder that keeps location filter results across runs.
     Returns:
         None
     """
@@ -59,6 +177,7 @@ def run(output_path, lat, lon, week, threshold, sortby):
     # Set config
     cfg.LATITUDE, cfg.LONGITUDE, cfg.WEEK = lat, lon, week
     cfg.LOCATION_FILTER_THRESHOLD = threshold
+    cfg.SPECIES_MASK_CACHE_DIR = cache_dir
 
     print(f"Getting species list for {cfg.LATITUDE}/{cfg.LONGITUDE}, Week {cfg.WEEK}...", end="", flush=True)
 
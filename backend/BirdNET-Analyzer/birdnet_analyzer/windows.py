@@ -0,0 +1,118 @@
+"""Module for splitting signals into analysis windows and scoring their energy.
+
+Depends on numpy only: the audio Lambda ships this file without the rest of the package
+and imports it from there, so both split and gate recordings the same way.
+"""
+
+import numpy as np
+
+
+def last_window_pos(size: int, chunksize: int, stepsize: int, minsize: int) -> int:
+    """Start of the last window of a signal.
+
+    Args:
+        size: Number of samples of the signal.
+        chunksize: Number of samples per window.
+        stepsize: Number of samples between the starts of consecutive windows.
+        minsize: Minimum number of signal samples in the last window, shorter tails are omitted.
+
+    Returns:
+        The sample offset of the last window; at least one window is always returned.
+    """
+    # Start of last chunk
+    lastchunkpos = int((size - chunksize + stepsize - 1) / stepsize) * stepsize
+    # Make sure at least one chunk is returned
+    if lastchunkpos < 0:
+        lastchunkpos = 0
+    # Omit last chunk if minimum signal duration is underrun
+    elif size - lastchunkpos < minsize:
+        lastchunkpos = lastchunkpos - stepsize
+
+    return lastchunkpos
+
+
+def sliding_windows(sig, chunksize, stepsize, minsize, fill=None):
+    """Split a signal into fixed-size windows without copying it.
+
+    Complete windows are returned as a read-only strided view into the signal.
+    Only the windows that run past the end of the signal are copied and padded.
+
+    Args:
+        sig: The 1-D signal.
+        chunksize: Number of samples per window.
+        stepsize: Number of samples between the starts of consecutive windows.
+        minsize: Minimum number of signal samples in the last window, shorter tails are omitted.
+        fill: Padding for the tail, at least chunksize samples long. Zeros if None.
+
+    Returns:
+        A tuple (body, tail) of 2-D arrays with chunksize columns. Their rows, in order, are the windows.
+    """
+    lastchunkpos = last_window_pos(sig.size, chunksize, stepsize, minsize)
+
+    num_chunks = lastchunkpos // stepsize + 1
+    num_full = min(num_chunks, (sig.size - chunksize) // stepsize + 1) if sig.size >= chunksize else 0
+
+    if num_full > 0:
+        body = sig[: (num_full - 1) * stepsize + chunksize]
+        body = np.lib.stride_tricks.sliding_window_view(body, chunksize)[::stepsize]
+    else:
+        body = np.empty((0, chunksize), dtype=sig.dtype)
+
+    if num_full == num_chunks:
+        return body, np.empty((0, chunksize), dtype=sig.dtype)
+
+    # Copy and pad only the part of the signal the tail windows cover
+    tail_start = num_full * stepsize
+    padsize = lastchunkpos + chunksize - sig.size
+    padding = np.zeros(padsize, dtype=sig.dtype) if fill is None else fill[:padsize]
+    tail = np.concatenate((sig[tail_start:], padding))
+    tail = np.lib.stride_tricks.sliding_window_view(tail, chunksize)[::stepsize]
+
+    return body, tail
+
+
+def window_energy(windows, block_size=64):
+    """Weighted RMS and peak energy of each window.
+
+    Same metric as birdnet_analyzer.audio.smart_crop_signal, computed for a block of windows
+    at a time so only block_size windows are ever copied.
+
+    Args:
+        windows: A 2-D array or a list of equally long windows.
+        block_size: Number of windows processed at once.
+
+    Returns:
+        A float32 array with one energy value per window.
+    """
+    energies = np.empty(len(windows), dtype=np.float32)
+
+    for i in range(0, len(windows), block_size):
+        block = np.asarray(windows[i : i + block_size], dtype=np.float32)
+        rms = np.sqrt(np.einsum("ij,ij->i", block, block) / block.shape[1])
+        peak = np.maximum(block.max(axis=1), -block.min(axis=1))
+        # Weighted combination
+        energies[i : i + len(block)] = rms * 0.7 + peak * 0.3
+
+    return energies
+
+
+def noise_floor_gate(energies, history, factor, percentile=10, min_windows=10):
+    """Find the windows whose energy stands out from the noise floor.
+
+    The noise floor is the given percentile of the energies in history, so it adapts to each recording.
+    With fewer than min_windows energies in history there is no reliable floor and every window is kept.
+
+    Args:
+        energies: The energies of the windows to decide on.
+        history: The energies the floor is estimated from, e.g. all windows of the recording so far.
+        factor: Windows need an energy above factor times the noise floor.
+        percentile: Percentile of the history used as noise floor.
+        min_windows: Minimum number of energies in history needed to estimate the floor.
+
+    Returns:
+        A boolean array, True for the windows that should be analyzed.
+    """
+    if len(history) < min_windows:
+        return np.ones(len(energies), dtype=bool)
+
+    return np.asarray(energies) > np.percentile(history, percentile) * factor
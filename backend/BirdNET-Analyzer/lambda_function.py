@@ -3,14 +3,26 @@ import json
 import boto3
 import shutil
 import subprocess
+import tempfile
+import queue
+import threading
+import time
+import datetime
+import struct
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from decimal import Decimal
 import numpy as np
-import scipy.io.wavfile
 from urllib.parse import unquote_plus
 import logging
 
 # Direct TFLite import
 import tensorflow.lite as tflite
 
+# Numpy-only windowing shared with the analyzer; the image ships this one file of the package
+from birdnet_analyzer.windows import last_window_pos, noise_floor_gate, sliding_windows, window_energy
+
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
@@ -21,8 +33,54 @@ s3_client = boto3.client('s3')
 # --- CONFIG ---
 SIG_LENGTH = 3.0
 SIG_OVERLAP = 0.0
+SIG_MINLEN = 1.0
 SAMPLE_RATE = 48000
 CONFIDENCE_THRESHOLD = 0.4
+FFMPEG_BIN = '/usr/bin/ffmpeg'
+FFPROBE_BIN = '/usr/bin/ffprobe'
+# Number of 3-second windows fed to the interpreter per invoke
+BATCH_SIZE = int(os.environ.get('BATCH_SIZE', 32))
+# Streaming mode pipes the S3 body through FFmpeg and infers while decoding,
+# so memory stays flat regardless of recording length
+STREAMING = os.environ.get('STREAMING', 'false').lower() in ('1', 'true', 'yes')
+STREAM_BLOCK_SECONDS = 30
+STREAM_QUEUE_BLOCKS = 4
+# Skip windows whose energy is not above ENERGY_GATE times the recording's noise floor
+# (the ENERGY_GATE_PERCENTILE-th percentile of window energies). 0 disables the gate.
+ENERGY_GATE = float(os.environ.get('ENERGY_GATE', 0))
+ENERGY_GATE_PERCENTILE = 10
+ENERGY_GATE_MIN_WINDOWS = 10
+# Records downloaded and decoded ahead of the one in inference
+PREFETCH_RECORDS = max(1, int(os.environ.get('PREFETCH_RECORDS', 1)))
+# Species prior from the meta-model, used for objects with lat/lon (and optionally date)
+# in their S3 metadata. Masks are cached per LOCATION_GRID_DEGREES cell and week.
+# Unset disables the location filter.
+META_MODEL_PATH = os.environ.get('META_MODEL_PATH', '')
+LOCATION_FILTER_THRESHOLD = float(os.environ.get('LOCATION_FILTER_THRESHOLD', 0.03))
+LOCATION_GRID_DEGREES = float(os.environ.get('LOCATION_GRID_DEGREES', 1.0))
+# Optional atlas file from birdnet-species-atlas; if present, masks are read from it
+# (with its own grid and threshold) and the meta-model is never loaded
+SPECIES_ATLAS_PATH = os.environ.get('SPECIES_ATLAS_PATH', '')
+# One structured per-record log line with stage timings; off removes all timing calls
+METRICS = os.environ.get('METRICS', 'true').lower() in ('1', 'true', 'yes')
+# Also store per-species max/mean confidence and first/last detection time
+STORE_TAG_DETAILS = os.environ.get('STORE_TAG_DETAILS', 'false').lower() in ('1', 'true', 'yes')
+
+# --- MODEL CACHE ---
+# Built lazily on first use and reused by every record of every warm invocation
+INTERPRETER = None
+LABELS = None
+SPECIES = None
+LOADED_MODEL_PATH = None
+LOADED_LABELS_FILE = None
+MODEL_LOCK = threading.Lock()
+COLD_START = True
+META_INTERPRETER = None
+# (lat cell, lon cell, week) -> float32 class mask
+SPECIES_MASKS = {}
+META_LOCK = threading.Lock()
+# (header, memory-mapped masks) of the species atlas
+ATLAS = None
 
 def load_labels(labels_file):
     labels = []
@@ -31,125 +89,785 @@ def load_labels(labels_file):
             labels.append(line.strip())
     return labels
 
-def load_audio_ffmpeg(input_path, target_sr=48000):
+def ffmpeg_pcm_command(input_path, target_sr=48000):
     """
-    Uses the system FFmpeg to decode and resample audio to 48kHz Mono.
-    This bypasses Librosa/Numba segfaults.
+    FFmpeg command that decodes and resamples to 48kHz Mono
+    and writes raw float32 PCM (f32le) to stdout.
     """
-    output_wav = "/tmp/temp_audio.wav"
-    
-    # Command: ffmpeg -y -i input -ar 48000 -ac 1 -c:a pcm_s16le output.wav
-    cmd = [
-        '/usr/bin/ffmpeg', 
-        '-y',                 # Overwrite output
+    return [
+        FFMPEG_BIN,
         '-v', 'error',        # Suppress logs
         '-i', input_path,     # Input file
         '-ar', str(target_sr),# Resample to 48k
         '-ac', '1',           # Mix to Mono
-        '-f', 'wav',          # Force WAV format
-        '-c:a', 'pcm_s16le',  # Force standard 16-bit PCM (for Scipy compatibility)
-        output_wav
+        '-f', 'f32le',        # Raw little-endian float32, no container
+        '-c:a', 'pcm_f32le',
+        'pipe:1'              # Write to stdout
     ]
-    
-    # Run FFmpeg process
-    subprocess.check_call(cmd)
-    
-    # Read the clean WAV file using standard SciPy
-    sr, data = scipy.io.wavfile.read(output_wav)
-    
-    # Convert int16 to float32 between -1.0 and 1.0 (BirdNET expects this)
-    if data.dtype == np.int16:
-        data = data.astype(np.float32) / 32768.0
-    elif data.dtype == np.int32:
-        data = data.astype(np.float32) / 2147483648.0
-    elif data.dtype == np.uint8:
-        data = (data.astype(np.float32) - 128.0) / 128.0
-        
-    return data
 
-def predict(interpreter, samples):
+def probe_duration(input_path):
+    """Reads the duration in seconds from the container header, or None if unknown."""
+    try:
+        out = subprocess.check_output(
+            [FFPROBE_BIN, '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', input_path]
+        )
+        return float(out.strip())
+    except (subprocess.CalledProcessError, ValueError, OSError):
+        return None
+
+def stderr_tail(stderr_file, limit=4096):
+    """
+    Reads the last limit bytes FFmpeg wrote to stderr_file.
+    stderr goes to a temporary file rather than a pipe, so a flood of decode
+    errors can never fill the pipe buffer and block FFmpeg while we read stdout.
+    """
+    stderr_file.seek(0, os.SEEK_END)
+    stderr_file.seek(max(0, stderr_file.tell() - limit))
+    return stderr_file.read()
+
+def load_audio_ffmpeg(input_path, target_sr=48000):
+    """
+    Uses the system FFmpeg to decode and resample audio to 48kHz Mono.
+    This bypasses Librosa/Numba segfaults.
+    PCM is read from FFmpeg's stdout straight into a preallocated float32 buffer,
+    so no PCM is written to /tmp and no int16 copy is ever held.
+    """
+    # Size the buffer from the header (plus a second of slack), grow if it was wrong
+    duration = probe_duration(input_path)
+    capacity = int((duration + 1.0) * target_sr) if duration else 60 * target_sr
+    data = np.empty(capacity, dtype=np.float32)
+    nbytes = 0
+
+    with tempfile.TemporaryFile() as stderr_file:
+        proc = subprocess.Popen(ffmpeg_pcm_command(input_path, target_sr), stdout=subprocess.PIPE, stderr=stderr_file)
+        try:
+            while True:
+                if nbytes == data.nbytes:
+                    grown = np.empty(data.size * 2, dtype=np.float32)
+                    grown[:data.size] = data
+                    data = grown
+
+                n = proc.stdout.readinto(memoryview(data).cast('B')[nbytes:])
+                if not n:
+                    break
+                nbytes += n
+        finally:
+            proc.stdout.close()
+            proc.wait()
+            stderr = stderr_tail(stderr_file)
+
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, proc.args, stderr=stderr)
+
+    return data[:nbytes // 4]
+
+def stream_audio_ffmpeg(source, block_size, target_sr=48000):
+    """
+    Generator version of load_audio_ffmpeg.
+    Yields float32 blocks of block_size samples (the last one may be shorter)
+    as FFmpeg decodes them, so inference can start before decoding finishes.
+    source is a file path or a readable file-like object (e.g. an S3 StreamingBody),
+    which is fed to FFmpeg's stdin from a separate thread.
+    """
+    from_stream = not isinstance(source, str)
+    cmd = ffmpeg_pcm_command('pipe:0' if from_stream else source, target_sr)
+    # stderr goes to a file, see stderr_tail
+    stderr_file = tempfile.TemporaryFile()
+    proc = subprocess.Popen(
+        cmd,
+        stdin=subprocess.PIPE if from_stream else None,
+        stdout=subprocess.PIPE,
+        stderr=stderr_file
+    )
+
+    feed_errors = []
+    feeder = None
+    if from_stream:
+        def feed():
+            try:
+                shutil.copyfileobj(source, proc.stdin, 1 << 20)
+            except BrokenPipeError:
+                pass  # FFmpeg exited early, its return code tells why
+            except Exception as e:
+                feed_errors.append(e)
+            finally:
+                try:
+                    proc.stdin.close()
+                except BrokenPipeError:
+                    pass
+
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+
+    try:
+        while True:
+            block = np.empty(block_size, dtype=np.float32)
+            view = memoryview(block).cast('B')
+            nbytes = 0
+            while nbytes < block.nbytes:
+                n = proc.stdout.readinto(view[nbytes:])
+                if not n:
+                    break
+                nbytes += n
+
+            if nbytes >= 4:
+                yield block[:nbytes // 4]
+            if nbytes < block.nbytes:
+                break
+    finally:
+        proc.stdout.close()
+        proc.wait()
+        stderr = stderr_tail(stderr_file)
+        stderr_file.close()
+        if feeder is not None:
+            feeder.join()
+
+    if feed_errors:
+        raise feed_errors[0]
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, proc.args, stderr=stderr)
+
+def decode_in_background(source, block_size, max_blocks=STREAM_QUEUE_BLOCKS):
+    """
+    Runs stream_audio_ffmpeg on its own thread and yields its blocks through a bounded queue,
+    so decoding the next blocks overlaps with inference on the current one.
+    At most max_blocks decoded blocks are held at any time.
+    """
+    blocks = queue.Queue(maxsize=max_blocks)
+    stop = threading.Event()
+    end = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                blocks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def decode():
+        gen = stream_audio_ffmpeg(source, block_size)
+        try:
+            for block in gen:
+                if not put(block):
+                    return
+            put(end)
+        except Exception as e:
+            put(e)
+        finally:
+            gen.close()
+
+    worker = threading.Thread(target=decode, daemon=True)
+    worker.start()
+
+    try:
+        while True:
+            item = blocks.get()
+            if item is end:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        worker.join()
+
+def parse_species(labels):
+    """
+    Parses the labels once into per-species lookup arrays.
+    Label format is usually "ID_Scientific_Common"; the last part is the tag name.
+    Returns (names, class_to_species): the unique common names and, for every class,
+    the index of its common name in names.
+    """
+    common_names = [label.split('_')[-1] for label in labels]
+    names, class_to_species = np.unique(np.array(common_names, dtype=object), return_inverse=True)
+    return names, class_to_species
+
+def get_model(model_path, labels_file):
+    """
+    Returns the cached interpreter and parsed species, building them on first use.
+    The cache is rebuilt if MODEL_PATH or LABELS_FILE changed since the last load.
+    Returns (interpreter, species, load_time); species is the parse_species result,
+    load_time is 0.0 on a warm hit.
+    """
+    global INTERPRETER, LABELS, SPECIES, LOADED_MODEL_PATH, LOADED_LABELS_FILE
+
+    with MODEL_LOCK:
+        if INTERPRETER is not None and LOADED_MODEL_PATH == model_path and LOADED_LABELS_FILE == labels_file:
+            return INTERPRETER, SPECIES, 0.0
+
+        t0 = time.perf_counter()
+
+        # Build into locals first, so a failed load never leaves a half-swapped cache
+        interpreter = tflite.Interpreter(model_path=model_path, num_threads=1)
+        interpreter.allocate_tensors()
+        labels = load_labels(labels_file)
+        species = parse_species(labels)
+
+        INTERPRETER, LABELS, SPECIES = interpreter, labels, species
+        LOADED_MODEL_PATH, LOADED_LABELS_FILE = model_path, labels_file
+
+        return INTERPRETER, SPECIES, time.perf_counter() - t0
+
+def parse_location(metadata):
+    """
+    Reads the optional recording location and date from S3 user metadata
+    (x-amz-meta-lat, x-amz-meta-lon, x-amz-meta-date as YYYY-MM-DD).
+    Returns (lat, lon, week), with week -1 (year-round) if there is no date,
+    or None if the object has no usable location.
+    """
+    if 'lat' not in metadata or 'lon' not in metadata:
+        return None
+
+    try:
+        lat, lon = float(metadata['lat']), float(metadata['lon'])
+        week = -1
+        if metadata.get('date'):
+            date = datetime.date.fromisoformat(metadata['date'][:10])
+            # BirdNET weeks: 4 per month, 48 per year
+            week = (date.month - 1) * 4 + min(4, (date.day - 1) // 7 + 1)
+    except ValueError:
+        logger.warning(f"Ignoring invalid location metadata: {metadata}")
+        return None
+
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        logger.warning(f"Ignoring out of range location: {lat}, {lon}")
+        return None
+
+    return lat, lon, week
+
+def predict_filter(lat, lon, week):
+    """Meta-model occurrence scores for every class, mirroring birdnet_analyzer.model.predict_filter."""
+    global META_INTERPRETER
+
+    if META_INTERPRETER is None:
+        META_INTERPRETER = tflite.Interpreter(model_path=META_MODEL_PATH, num_threads=1)
+        META_INTERPRETER.allocate_tensors()
+
+    sample = np.expand_dims(np.array([lat, lon, week], dtype=np.float32), 0)
+    META_INTERPRETER.set_tensor(META_INTERPRETER.get_input_details()[0]['index'], sample)
+    META_INTERPRETER.invoke()
+
+    return META_INTERPRETER.get_tensor(META_INTERPRETER.get_output_details()[0]['index'])[0]
+
+def get_species_mask(location):
+    """
+    Returns the float32 class mask (1 = plausible at this place and week) for a
+    parse_location result. The meta-model runs once per grid cell and week;
+    every recording in the same cell reuses the cached mask.
+    """
+    lat, lon, week = location
+    cell = (int(np.floor(lat / LOCATION_GRID_DEGREES)), int(np.floor(lon / LOCATION_GRID_DEGREES)), week)
+
+    with META_LOCK:
+        mask = SPECIES_MASKS.get(cell)
+        if mask is None:
+            # Score the cell centre, so every recording in the cell gets the same list
+            center_lat = (cell[0] + 0.5) * LOCATION_GRID_DEGREES
+            center_lon = (cell[1] + 0.5) * LOCATION_GRID_DEGREES
+            scores = predict_filter(center_lat, center_lon, week)
+            mask = (scores >= LOCATION_FILTER_THRESHOLD).astype(np.float32)
+            SPECIES_MASKS[cell] = mask
+
+    return mask
+
+def load_atlas(path):
+    """
+    Memory-maps an atlas file, mirroring birdnet_analyzer.species.atlas.SpeciesAtlas.
+    Returns (header, masks) with masks of shape (lat cells, lon cells, 49 weeks, bytes).
+    """
+    with open(path, 'rb') as f:
+        if f.read(8) != b'BNATLAS1':
+            raise ValueError(f"{path} is not a species atlas")
+        (header_length,) = struct.unpack('<I', f.read(4))
+        header = json.loads(f.read(header_length))
+
+    offset = -(-(12 + header_length) // 64) * 64
+    masks = np.memmap(path, dtype=np.uint8, mode='r', offset=offset, shape=tuple(header['shape']))
+    return header, masks
+
+def get_atlas_mask(location):
+    """
+    Returns the float32 class mask for a parse_location result from the atlas.
+    Only reads the packed bits of one cell and week from the mapped file.
+    """
+    global ATLAS
+
+    with META_LOCK:
+        if ATLAS is None:
+            ATLAS = load_atlas(SPECIES_ATLAS_PATH)
+            logger.info(f"Loaded species atlas {SPECIES_ATLAS_PATH}: {ATLAS[0]['resolution']} degree cells")
+    header, masks = ATLAS
+
+    lat, lon, week = location
+    resolution = header['resolution']
+    lat_idx = min(masks.shape[0] - 1, max(0, int((lat + 90) // resolution)))
+    lon_idx = int((lon + 180) // resolution) % masks.shape[1]
+
+    # Week slot 0 is the year-round list
+    bits = np.unpackbits(masks[lat_idx, lon_idx, max(0, week)], count=header['num_classes'])
+    return bits.astype(np.float32)
+
+def resize_input(interpreter, batch_size, chunk_size):
+    """Resizes the input tensor to [batch_size, chunk_size], only when the shape actually changes."""
+    input_details = interpreter.get_input_details()
+    if list(input_details[0]['shape']) != [batch_size, chunk_size]:
+        interpreter.resize_tensor_input(input_details[0]['index'], [batch_size, chunk_size])
+        interpreter.allocate_tensors()
+
+def gate_mask(energies, history):
+    """
+    True for the windows whose energy is above ENERGY_GATE times the noise floor,
+    estimated as a percentile of history (all energies seen so far, including these).
+    Everything is kept until there are enough windows for a reliable floor.
+    """
+    if ENERGY_GATE <= 0:
+        return np.ones(len(energies), dtype=bool)
+    return noise_floor_gate(energies, history, ENERGY_GATE, ENERGY_GATE_PERCENTILE, ENERGY_GATE_MIN_WINDOWS)
+
+def predict(interpreter, samples, batch_size=BATCH_SIZE, stats=None):
+    """
+    Runs batched inference over all windows of the signal.
+    Windows skipped by the energy gate are not run and keep all-zero scores.
+    If a stats dict is given, the number of skipped windows is stored in it.
+    """
     input_details = interpreter.get_input_details()
     output_details = interpreter.get_output_details()
+    num_classes = output_details[0]['shape'][-1]
     
     # Calculate chunk sizes
     chunk_size = int(SIG_LENGTH * SAMPLE_RATE)
     step_size = int((SIG_LENGTH - SIG_OVERLAP) * SAMPLE_RATE)
+    min_size = int(SIG_MINLEN * SAMPLE_RATE)
     
-    output_data = []
+    body, tail = sliding_windows(samples, chunk_size, step_size, min_size)
+    num_windows = len(body) + len(tail)
+
+    # Energy gate on the whole recording
+    kept = np.arange(num_windows)
+    if ENERGY_GATE > 0:
+        energies = np.concatenate((window_energy(body), window_energy(tail)))
+        kept = np.flatnonzero(gate_mask(energies, energies))
+    if stats is not None:
+        stats['skipped_windows'] = num_windows - len(kept)
+
+    output_data = np.zeros((num_windows, num_classes), dtype=np.float32)
+    if len(kept) == 0:
+        return output_data
+
+    # Never allocate a batch larger than the recording needs
+    batch_size = max(1, min(batch_size, len(kept)))
+    resize_input(interpreter, batch_size, chunk_size)
+
+    batch = np.zeros((batch_size, chunk_size), dtype=np.float32)
     
-    # Sliding window inference
-    for i in range(0, len(samples) - chunk_size + 1, step_size):
-        chunk = samples[i:i + chunk_size]
-        
-        # Prepare tensor
-        input_tensor = chunk.reshape(1, chunk_size).astype(np.float32)
-        interpreter.set_tensor(input_details[0]['index'], input_tensor)
+    # Sliding window inference, batch_size windows per invoke
+    for b in range(0, len(kept), batch_size):
+        idx = kept[b:b + batch_size]
+        n = len(idx)
+
+        # Windows come from the strided body first, then the padded tail
+        n_body = int(np.count_nonzero(idx < len(body)))
+        batch[:n_body] = body[idx[:n_body]]
+        batch[n_body:n] = tail[idx[n_body:] - len(body)]
+
+        # Last partial batch: zero the unused rows and drop their outputs
+        if n < batch_size:
+            batch[n:] = 0.0
         
+        interpreter.set_tensor(input_details[0]['index'], batch)
         interpreter.invoke()
-        output_data.append(interpreter.get_tensor(output_details[0]['index'])[0])
+        output_data[idx] = interpreter.get_tensor(output_details[0]['index'])[:n]
+
+    return output_data
+
+def predict_stream(interpreter, blocks, batch_size=BATCH_SIZE, stats=None):
+    """
+    Streaming version of predict.
+    Consumes PCM blocks as they arrive and yields a prediction array for every batch,
+    keeping only the current batch and less than one window of carried-over samples in memory.
+    Produces the same windows, in the same order, as predict on the concatenated signal.
+    The energy gate's noise floor is estimated from the windows seen so far.
+    If a stats dict is given, the skipped windows and decoded samples are stored in it.
+    """
+    input_details = interpreter.get_input_details()
+    output_details = interpreter.get_output_details()
+    num_classes = output_details[0]['shape'][-1]
+
+    chunk_size = int(SIG_LENGTH * SAMPLE_RATE)
+    step_size = int((SIG_LENGTH - SIG_OVERLAP) * SAMPLE_RATE)
+    min_size = int(SIG_MINLEN * SAMPLE_RATE)
+
+    # Length is unknown up front, so the batch shape stays fixed
+    resize_input(interpreter, batch_size, chunk_size)
+    batch = np.zeros((batch_size, chunk_size), dtype=np.float32)
+    n = 0
+    # Kept/skipped flag for every window since the last flush, in order
+    order = []
+    energy_history = []
+    skipped = 0
+
+    def flush():
+        nonlocal n, order
+        output = np.zeros((len(order), num_classes), dtype=np.float32)
+        if n > 0:
+            # Last partial batch: zero the unused rows and drop their outputs
+            batch[n:] = 0.0
+            interpreter.set_tensor(input_details[0]['index'], batch)
+            interpreter.invoke()
+            output[np.flatnonzero(order)] = interpreter.get_tensor(output_details[0]['index'])[:n]
+        n = 0
+        order = []
+        return output
+
+    def add_windows(windows):
+        nonlocal n, skipped
+        keep = np.ones(len(windows), dtype=bool)
+        if ENERGY_GATE > 0:
+            energies = window_energy(windows)
+            energy_history.extend(energies.tolist())
+            keep = gate_mask(energies, energy_history)
+            skipped += len(windows) - int(np.count_nonzero(keep))
+
+        for window, kept in zip(windows, keep):
+            order.append(kept)
+            if not kept:
+                continue
+            batch[n] = window
+            n += 1
+            if n == batch_size:
+                yield flush()
+
+    # carry holds the samples from global offset `consumed` that do not yet fill a window
+    carry = np.empty(0, dtype=np.float32)
+    consumed = 0
+    total = 0
+
+    for block in blocks:
+        total += len(block)
+        buf = np.concatenate((carry, block))
+        num_full = (buf.size - chunk_size) // step_size + 1 if buf.size >= chunk_size else 0
+
+        if num_full > 0:
+            windows = buf[:(num_full - 1) * step_size + chunk_size]
+            windows = np.lib.stride_tricks.sliding_window_view(windows, chunk_size)[::step_size]
+            yield from add_windows(windows)
+
+        carry = buf[num_full * step_size:].copy()
+        consumed += num_full * step_size
+
+    # Padded tail windows, decided on the full length like sliding_windows does
+    last_pos = last_window_pos(total, chunk_size, step_size, min_size)
+    if last_pos >= consumed:
+        tail = np.zeros(last_pos + chunk_size - consumed, dtype=np.float32)
+        tail[:carry.size] = carry
+        yield from add_windows(np.lib.stride_tricks.sliding_window_view(tail, chunk_size)[::step_size])
+
+    if order:
+        yield flush()
+
+    if stats is not None:
+        stats['skipped_windows'] = skipped
+        stats['samples'] = total
+
+class TagAggregator:
+    """
+    Vectorized per-species aggregation of window predictions.
+    Every update() thresholds a whole (windows, classes) prediction matrix at once;
+    updates can be fed batch by batch (streaming) or with the full matrix.
+    """
+
+    def __init__(self, species, threshold=CONFIDENCE_THRESHOLD):
+        self.names, self.class_to_species = species
+        self.threshold = threshold
+        num_classes = len(self.class_to_species)
+        self.counts = np.zeros(num_classes, dtype=np.int64)
+        self.score_sum = np.zeros(num_classes, dtype=np.float64)
+        self.score_max = np.zeros(num_classes, dtype=np.float32)
+        self.first = np.full(num_classes, -1, dtype=np.int64)
+        self.last = np.full(num_classes, -1, dtype=np.int64)
+        self.num_windows = 0
+
+    def update(self, predictions):
+        # Outputs beyond the label list have no name
+        preds = np.asarray(predictions)[:, :len(self.class_to_species)]
+        if len(preds) == 0:
+            return
+
+        hits = preds >= self.threshold
+        counts = hits.sum(axis=0)
+        seen = counts > 0
+
+        scores = np.where(hits, preds, 0.0)
+        self.counts += counts
+        self.score_sum += scores.sum(axis=0)
+        np.maximum(self.score_max, scores.max(axis=0), out=self.score_max)
+
+        first = self.num_windows + hits.argmax(axis=0)
+        last = self.num_windows + len(preds) - 1 - hits[::-1].argmax(axis=0)
+        new = seen & (self.first < 0)
+        self.first[new] = first[new]
+        self.last[seen] = last[seen]
+
+        self.num_windows += len(preds)
+
+    def tags(self):
+        """Returns {common_name: number of windows at or above the threshold}."""
+        counts = np.bincount(self.class_to_species, weights=self.counts, minlength=len(self.names))
+        return {str(self.names[i]): int(counts[i]) for i in np.flatnonzero(counts)}
+
+    def details(self, step_seconds=SIG_LENGTH - SIG_OVERLAP):
+        """
+        Returns {common_name: {count, max_confidence, mean_confidence, first_seconds, last_seconds}},
+        with times as the start of the first and last detected window.
+        """
+        seen = np.flatnonzero(self.counts)
+        species = self.class_to_species[seen]
+        num_species = len(self.names)
+
+        counts = np.bincount(species, weights=self.counts[seen], minlength=num_species)
+        score_sum = np.bincount(species, weights=self.score_sum[seen], minlength=num_species)
+        score_max = np.zeros(num_species, dtype=np.float32)
+        np.maximum.at(score_max, species, self.score_max[seen])
+        first = np.full(num_species, np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(first, species, self.first[seen])
+        last = np.full(num_species, -1, dtype=np.int64)
+        np.maximum.at(last, species, self.last[seen])
+
+        return {
+            str(self.names[i]): {
+                'count': int(counts[i]),
+                'max_confidence': float(score_max[i]),
+                'mean_confidence': float(score_sum[i] / counts[i]),
+                'first_seconds': float(first[i] * step_seconds),
+                'last_seconds': float(last[i] * step_seconds),
+            }
+            for i in np.flatnonzero(counts)
+        }
 
-    return np.array(output_data)
+def to_dynamodb(details):
+    """DynamoDB rejects floats, so numbers are stored as rounded Decimals."""
+    return {
+        name: {k: Decimal(str(round(v, 4))) for k, v in stats.items()}
+        for name, stats in details.items()
+    }
+
+NO_OP = nullcontext()
+
+class RecordMetrics:
+    """
+    Per-stage durations and counters for one record, logged as one JSON line
+    ({"metric": "audio_record", "key": ..., "status": ..., "<stage>_s": ...}) that
+    CloudWatch Logs Insights and metric filters can parse directly.
+    When METRICS is off, stage() hands out a shared no-op context and nothing is timed or logged.
+    """
+
+    def __init__(self, key, cold_start, enabled=METRICS):
+        self.enabled = enabled
+        self.values = {'key': key, 'cold_start': cold_start} if enabled else {}
+
+    def stage(self, name):
+        """Context manager timing one stage into <name>_s; stages run more than once add up."""
+        if not self.enabled:
+            return NO_OP
+        return self._timed(name + '_s')
+
+    @contextmanager
+    def _timed(self, field):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.values[field] = self.values.get(field, 0.0) + time.perf_counter() - t0
+
+    def set(self, name, value):
+        if self.enabled:
+            self.values[name] = value
+
+    def emit(self, status):
+        """Logs the record line and returns it (just key and status when disabled)."""
+        if not self.enabled:
+            return {'status': status}
+
+        values = self.values
+        values['status'] = status
+        values['model_cold'] = values.get('model_load_s', 0.0) > 0
+        if 'audio_samples' in values:
+            values['audio_seconds'] = values.pop('audio_samples') / SAMPLE_RATE
+        infer_time = values.get('inference_s', values.get('stream_s', 0.0))
+        if infer_time > 0 and 'windows' in values:
+            values['windows_per_second'] = values['windows'] / infer_time
+
+        line = {'metric': 'audio_record'}
+        line.update((k, round(v, 4) if isinstance(v, float) else v) for k, v in values.items())
+        logger.info(json.dumps(line))
+        return line
+
+def fetch_audio(bucket, key, metrics):
+    """
+    Downloads and decodes one record into its own scratch directory,
+    so records fetched concurrently never share a path.
+    Returns (sig, metadata); metadata is the object's S3 user metadata,
+    only requested when a location filter is configured.
+    """
+    scratch = tempfile.mkdtemp(prefix='audio-', dir='/tmp')
+    local_input = os.path.join(scratch, os.path.basename(key))
+    try:
+        # 1. Download
+        with metrics.stage('download'):
+            metadata = {}
+            if location_filter_enabled():
+                metadata = s3_client.head_object(Bucket=bucket, Key=key)['Metadata']
+            s3_client.download_file(bucket, key, local_input)
+
+        # 2. Decode Audio (The Crash-Proof Way)
+        # This calls FFmpeg directly, avoiding the Python Segfault
+        with metrics.stage('decode'):
+            sig = load_audio_ffmpeg(local_input)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    return sig, metadata
+
+def location_filter_enabled():
+    """Whether a species atlas or meta-model is available to filter by location."""
+    if SPECIES_ATLAS_PATH and os.path.isfile(SPECIES_ATLAS_PATH):
+        return True
+    if not META_MODEL_PATH:
+        return False
+    if not os.path.isfile(META_MODEL_PATH):
+        logger.warning(f"Meta-model not found at {META_MODEL_PATH}, skipping location filter")
+        return False
+    return True
+
+def location_mask(metadata, metrics):
+    """Species mask for the object's location metadata, or None if it has no location."""
+    location = parse_location(metadata)
+    if location is None or not location_filter_enabled():
+        return None
+    if SPECIES_ATLAS_PATH and os.path.isfile(SPECIES_ATLAS_PATH):
+        with metrics.stage('location_filter'):
+            return get_atlas_mask(location)
+    with metrics.stage('location_filter'):
+        return get_species_mask(location)
+
+def process_record(bucket, key, fetched, model_path, labels_file, metrics):
+    """
+    Runs inference for one record and writes its tags.
+    fetched is the fetch_audio future, or None in streaming mode.
+    Stage timings and counters go to metrics.
+    """
+    # Load Model (cached across records and warm invocations)
+    interpreter, species, load_time = get_model(model_path, labels_file)
+    metrics.set('model_load_s', load_time)
+    if load_time > 0:
+        logger.info(f"Cold model load: {load_time:.3f}s")
+
+    stats = {}
+    if STREAMING:
+        # Stream S3 -> FFmpeg -> bounded queue -> batched inference -> tags
+        # Download, decode and inference overlap, so they are timed as one stage
+        with metrics.stage('stream'):
+            response = s3_client.get_object(Bucket=bucket, Key=key)
+            species_mask = location_mask(response['Metadata'], metrics)
+            blocks = decode_in_background(response['Body'], int(STREAM_BLOCK_SECONDS * SAMPLE_RATE))
+            aggregator = TagAggregator(species)
+            for pred_batch in predict_stream(interpreter, blocks, stats=stats):
+                if species_mask is not None:
+                    pred_batch[:, :len(species_mask)] *= species_mask
+                aggregator.update(pred_batch)
+        metrics.set('audio_samples', stats['samples'])
+
+    else:
+        # Download and decode ran on the prefetch pool
+        sig, metadata = fetched.result()
+        species_mask = location_mask(metadata, metrics)
+        metrics.set('audio_samples', len(sig))
+
+        # 3. Run Inference
+        with metrics.stage('inference'):
+            raw_predictions = predict(interpreter, sig, stats=stats)
+        del sig
+
+        # 4. Aggregate Results
+        # Species the meta-model rules out for this place and week can never become tags
+        if species_mask is not None:
+            raw_predictions[:, :len(species_mask)] *= species_mask
+        aggregator = TagAggregator(species)
+        aggregator.update(raw_predictions)
+
+    tags = aggregator.tags()
+    logger.info(f"Detected tags: {tags}")
+    metrics.set('windows', aggregator.num_windows)
+    if ENERGY_GATE > 0:
+        metrics.set('skipped_windows', stats['skipped_windows'])
+
+    # 5. Save to DynamoDB
+    with metrics.stage('dynamodb'):
+        s3_url = f"https://{bucket}.s3.amazonaws.com/{key}"
+        item = {
+            's3_url': s3_url,
+            'file_type': 'audio',
+            'tags': tags
+        }
+        if STORE_TAG_DETAILS:
+            item['tag_details'] = to_dynamodb(aggregator.details())
+        media_table.put_item(Item=item)
 
 def lambda_handler(event, context):
+    global COLD_START
+
     # Setup Paths
     MODEL_PATH = os.environ.get('MODEL_PATH', '/var/task/model/BirdNET_GLOBAL_6K_V2.4_Model_FP16.tflite')
     LABELS_FILE = os.environ.get('LABELS_FILE', '/var/task/model/BirdNET_GLOBAL_6K_V2.4_Labels.txt')
 
-    processed_count = 0
+    # First invocation of this container
+    cold_start, COLD_START = COLD_START, False
 
-    for record in event['Records']:
-        bucket = record['s3']['bucket']['name']
-        key = unquote_plus(record['s3']['object']['key'])
-        logger.info(f"Processing: {key}")
+    records = [
+        (record['s3']['bucket']['name'], unquote_plus(record['s3']['object']['key']))
+        for record in event['Records']
+    ]
+    results = []
 
-        local_input = os.path.join("/tmp", os.path.basename(key))
-        
-        try:
-            # 1. Download
-            s3_client.download_file(bucket, key, local_input)
-            
-            # 2. Decode Audio (The Crash-Proof Way)
-            # This calls FFmpeg directly, avoiding the Python Segfault
-            sig = load_audio_ffmpeg(local_input)
-            
-            # 3. Load Model
-            interpreter = tflite.Interpreter(model_path=MODEL_PATH, num_threads=1)
-            interpreter.allocate_tensors()
-            labels = load_labels(LABELS_FILE)
-            
-            # 4. Run Inference
-            raw_predictions = predict(interpreter, sig)
-            
-            # 5. Aggregate Results
-            tags = {}
-            if len(raw_predictions) > 0:
-                for pred_chunk in raw_predictions:
-                    # Get top confident predictions
-                    indices = np.argwhere(pred_chunk >= CONFIDENCE_THRESHOLD).flatten()
-                    for idx in indices:
-                        if idx < len(labels):
-                            # Label format is usually "ID_Scientific_Common"
-                            parts = labels[idx].split('_')
-                            common_name = parts[-1] if len(parts) > 1 else labels[idx]
-                            tags[common_name] = tags.get(common_name, 0) + 1
-
-            logger.info(f"Detected tags: {tags}")
-
-            # 6. Save to DynamoDB
-            s3_url = f"https://{bucket}.s3.amazonaws.com/{key}"
-            media_table.put_item(Item={
-                's3_url': s3_url,
-                'file_type': 'audio',
-                'tags': tags
-            })
-            processed_count += 1
-            
-            # Cleanup
-            if os.path.exists(local_input): os.remove(local_input)
-            if os.path.exists("/tmp/temp_audio.wav"): os.remove("/tmp/temp_audio.wav")
+    # Record N+1 downloads and decodes on the pool while record N is in inference.
+    # PREFETCH_RECORDS fetches stay in flight next to the record in inference, so up to
+    # PREFETCH_RECORDS + 1 decoded records (and their downloads in /tmp) are held at once.
+    with ThreadPoolExecutor(max_workers=PREFETCH_RECORDS) as pool:
+        pending = deque()
+        upcoming = iter(records)
 
-        except Exception as e:
-            logger.error(f"Error {key}: {str(e)}")
-            continue
+        def prefetch():
+            while len(pending) < PREFETCH_RECORDS:
+                record = next(upcoming, None)
+                if record is None:
+                    return
+                metrics = RecordMetrics(record[1], cold_start)
+                fetched = None if STREAMING else pool.submit(fetch_audio, *record, metrics)
+                pending.append((*record, fetched, metrics))
+
+        prefetch()
+        while pending:
+            bucket, key, fetched, metrics = pending.popleft()
+            prefetch()
+            logger.info(f"Processing: {key}")
+
+            try:
+                with metrics.stage('total'):
+                    process_record(bucket, key, fetched, MODEL_PATH, LABELS_FILE, metrics)
+                status = 'ok'
+            except Exception as e:
+                # One bad record must not stop the others
+                logger.error(f"Error {key}: {str(e)}")
+                status = 'error'
+
+            results.append({'key': key, **metrics.emit(status)})
+
+    processed_count = sum(1 for r in results if r['status'] == 'ok')
 
-    return {'statusCode': 200, 'body': json.dumps(f'Processed {processed_count} files.')}
\ No newline at end of file
+    return {
+        'statusCode': 200,
+        'body': json.dumps(f'Processed {processed_count} files.'),
+        'records': results
+    }
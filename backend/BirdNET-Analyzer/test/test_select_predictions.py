@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+import birdnet_analyzer.config as cfg
+from birdnet_analyzer.analyze.utils import select_predictions
+
+
+@pytest.fixture
+def labels(monkeypatch):
+    labels = [f"Species {i}_Common {i}" for i in range(6)]
+    monkeypatch.setattr(cfg, "LABELS", labels)
+    monkeypatch.setattr(cfg, "SPECIES_LIST", [])
+    monkeypatch.setattr(cfg, "MIN_CONFIDENCE", 0.1)
+
+    return labels
+
+
+def test_top_n_ties_at_cutoff_keep_lowest_label_index(monkeypatch, labels):
+    monkeypatch.setattr(cfg, "TOP_N", 2)
+    # Labels 1, 2, 4 and 5 tie for the second place
+    p = np.array([[0.1, 0.5, 0.5, 0.9, 0.5, 0.5], [0.5, 0.5, 0.5, 0.5, 0.5, 0.5]])
+
+    window_idx, class_idx, score = select_predictions(p)
+
+    assert window_idx.tolist() == [0, 0, 1, 1]
+    assert class_idx.tolist() == [3, 1, 0, 1]
+    assert score.tolist() == [0.9, 0.5, 0.5, 0.5]
+
+
+def test_top_n_ties_at_cutoff_with_species_list(monkeypatch, labels):
+    monkeypatch.setattr(cfg, "TOP_N", 1)
+    monkeypatch.setattr(cfg, "SPECIES_LIST", [labels[2], labels[4]])
+    p = np.array([[0.9, 0.3, 0.3, 0.3, 0.3, 0.3]])
+
+    window_idx, class_idx, score = select_predictions(p)
+
+    assert class_idx.tolist() == [2]
+
+
+def test_top_n_without_species_on_list(monkeypatch, labels):
+    monkeypatch.setattr(cfg, "TOP_N", 3)
+    monkeypatch.setattr(cfg, "SPECIES_LIST", ["Not_A Species"])
+
+    window_idx, class_idx, score = select_predictions(np.full((2, 6), 0.5))
+
+    assert len(window_idx) == len(class_idx) == len(score) == 0
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from birdnet_analyzer.windows import last_window_pos, noise_floor_gate, sliding_windows, window_energy
+
+
+def copied_windows(sig, chunksize, stepsize, minsize):
+    """Reference: every window copied and zero-padded, one at a time."""
+    windows = []
+
+    for start in range(0, last_window_pos(sig.size, chunksize, stepsize, minsize) + 1, stepsize):
+        window = np.zeros(chunksize, dtype=sig.dtype)
+        part = sig[start : start + chunksize]
+        window[: len(part)] = part
+        windows.append(window)
+
+    return np.array(windows).reshape(-1, chunksize)
+
+
+@pytest.mark.parametrize("size", [0, 5, 99, 100, 101, 149, 150, 151, 1000, 1049, 1050])
+@pytest.mark.parametrize("stepsize", [50, 100])
+def test_sliding_windows_match_copied_windows(size, stepsize):
+    sig = np.arange(1, size + 1, dtype=np.float32)
+
+    body, tail = sliding_windows(sig, 100, stepsize, 50)
+
+    np.testing.assert_array_equal(np.concatenate((body, tail)), copied_windows(sig, 100, stepsize, 50))
+    assert np.shares_memory(body, sig) or not len(body)
+
+
+def test_sliding_windows_fill():
+    sig = np.ones(130, dtype=np.float32)
+    fill = np.full(100, -1, dtype=np.float32)
+
+    body, tail = sliding_windows(sig, 100, 100, 10, fill)
+
+    assert len(body) == len(tail) == 1
+    np.testing.assert_array_equal(tail[0], np.concatenate((np.ones(30), -np.ones(70))))
+
+
+def test_window_energy_blocks():
+    windows = np.random.default_rng(0).normal(0, 0.1, (130, 64)).astype(np.float32)
+    rms = np.sqrt((windows**2).mean(axis=1))
+    peak = np.abs(windows).max(axis=1)
+
+    np.testing.assert_allclose(window_energy(windows, block_size=16), rms * 0.7 + peak * 0.3, rtol=1e-5)
+    np.testing.assert_array_equal(window_energy(list(windows)), window_energy(windows))
+
+
+def test_noise_floor_gate():
+    energies = np.array([1.0] * 9 + [5.0])
+
+    assert noise_floor_gate(energies, energies[:5], 2.0).all()
+    assert noise_floor_gate(energies, energies, 2.0).tolist() == [False] * 9 + [True]